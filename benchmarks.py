@@ -0,0 +1,168 @@
+''' tagsPlorer benchmarks  (C) 2021-2021  Arne Bachmann  https://github.com/ArneBachmann/tagsplorer
+
+    Generates a synthetic folder tree, then measures indexing, index size, load times and representative searches.
+    Results are written as JSON, to compare them across versions and settings:
+      python3 benchmarks.py --depth 4 --fanout 8 --files 20 --set compact_index=True -o results.json
+'''
+
+import json, optparse, os, platform, random, shutil, statistics, subprocess, sys, tempfile, time
+
+from tagsplorer.constants import FROM, GLOBAL, INDEX, MTIME_SLACK, SKIPD, SKIPDS, SLASH
+from tagsplorer import lib
+from tagsplorer.lib import Configuration, Indexer
+from tagsplorer.utils import dd, dictGetSet, sjoin, wrapExc
+
+
+WORDS = ["alpha", "Beta", "project", "Projects", "archive", "docs", "photos", "src", "music", "backup", "Data", "misc_old", "2021"]  # folder and file name vocabulary
+
+
+def generate(root, depth = 3, fanout = 6, files = 10, exts = (".txt", ".jpg", ".py", ".pdf"), tags = 10, mappings = 5, settings = (), seed = 0):
+  ''' Create a synthetic folder tree plus configuration, deterministic for the same parameters.
+      root:     folder to create the tree in
+      depth:    number of folder levels below the root
+      fanout:   number of sub-folders per folder
+      files:    number of files per folder
+      exts:     file extensions to pick from
+      tags:     number of folders with configured tags (for all files with one extension)
+      mappings: number of folders that include another folder's files (FROM markers)
+      settings: global configuration settings as "key=value" strings
+      returns:  dictionary with numbers of created folders and files
+  '''
+  rnd = random.Random(seed)
+  folders, level = [""], [""]
+  for d in range(depth):
+    level = [parent + SLASH + f"{rnd.choice(WORDS)}-{d}.{i}" for parent in level for i in range(fanout)]
+    folders.extend(level)
+  created = set()
+  for folder in folders:
+    os.makedirs(root + folder, exist_ok = True)
+    for i in range(files):
+      name = root + folder + SLASH + f"{rnd.choice(WORDS).lower()}_{i}{rnd.choice(exts)}"
+      with open(name, "w"): created.add(name)
+  cfg = Configuration()
+  dictGetSet(cfg.paths, '', dd())[SKIPD] = SKIPDS
+  for setting in settings:
+    key, value = setting.split("=")[:2]
+    dictGetSet(cfg.paths[''], GLOBAL, []).append(f"{key.lower()}={value}")
+    cfg.__dict__[key.lower()] = value if value.lower() not in ("true", "false") else value.lower() == "true"
+  for n in range(tags): cfg.addTag(rnd.choice(folders), f"tag{n % 5}", ["*" + rnd.choice(exts)], [])
+  for n in range(mappings): dictGetSet(dictGetSet(cfg.paths, rnd.choice(folders[1:]), dd()), FROM, []).append(rnd.choice(folders[1:]))  # root-absolute mapped folder
+  cfg.store(root)
+  stamp = time.time() - 2 * MTIME_SLACK / 1e9  # like an existing tree: incremental walks only trust listings of folders modified well before the walk
+  for folder in folders: os.utime(root + folder, (stamp, stamp))
+  return {"folders": len(folders), "files": len(created)}
+
+
+def timed(func, repeat = 1):
+  ''' Run a function several times.
+      returns: 2-tuple(median duration in seconds, last result)
+  '''
+  durations = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = func()
+    durations.append(time.perf_counter() - start)
+  return statistics.median(durations), result
+
+
+def logCost(func, repeat = 1):
+  ''' Compare a function's duration with disabled log levels to formatting all log messages of the library anyway (as before checking levels first).
+      returns: dictionary with both durations and the time saved
+  '''
+  quiet, _ = timed(func, repeat)
+  eager = lambda log: (lambda *s: log(sjoin([_() if callable(_) else _ for _ in s])))  # evaluates and formats arguments, even if the logger then discards them
+  debug, info = lib.debug, lib.info
+  lib.debug, lib.info = eager(lib._log.debug), eager(lib._log.info)
+  try: formatted, _ = timed(func, repeat)
+  finally: lib.debug, lib.info = debug, info
+  return {"seconds": quiet, "formatted_seconds": formatted, "saved_seconds": formatted - quiet}
+
+
+def load(root, **kwargs):
+  i = Indexer(root)
+  i.load(os.path.join(root, INDEX), ignore_skew = True, **kwargs)
+  return i
+
+
+def benchmark(root, jobs = 1, repeat = 5, exts = (".txt", ".jpg", ".py", ".pdf")):
+  ''' Measure indexing, storing, loading and searching for the tree in root.
+      returns: dictionary with the results
+  '''
+  results = {}
+  cfg = Configuration()
+  cfg.load(root)
+  idx = Indexer(root)
+  duration, _ = timed(lambda: idx.walk(cfg, jobs = jobs))
+  folders = len(idx.getScans())
+  results["walk"] = {"seconds": duration, "folders": folders, "folders_per_second": folders / duration}
+  duration, rescanned = timed(lambda: idx.walk(incremental = True, jobs = jobs))
+  results["walk_incremental"] = {"seconds": duration, "rescanned": rescanned, "folders_per_second": folders / duration}
+  results["walk_logging"] = logCost(lambda: idx.walk(cfg, jobs = jobs), repeat)
+  duration, _ = timed(lambda: idx.store(os.path.join(root, INDEX)))
+  results["store"] = {"seconds": duration, "bytes": os.stat(os.path.join(root, INDEX)).st_size, "entries": len(idx.tagdirs)}
+
+  code = f"import time; from benchmarks import load; start = time.perf_counter(); load({root!r}); print(time.perf_counter() - start)"  # after interpreter start and imports
+  cold = [float(subprocess.check_output([sys.executable, "-c", code], cwd = os.path.dirname(os.path.abspath(__file__)))) for _ in range(repeat)]
+  warm, idx = timed(lambda: load(root), repeat)
+  results["load"] = {"cold_seconds": statistics.median(cold), "warm_seconds": warm}
+
+  queries = {  # name -> (inclusive terms, exclusive terms)
+    "tag":            (["alpha"], []),
+    "two tags":       (["alpha", "docs"], []),
+    "extension":      ([exts[0]], []),
+    "tag extension":  (["project", exts[-1]], []),
+    "exclude":        (["Data"], ["Beta"]),
+    "only exclude":   ([], ["archive"]),
+    "glob":           (["*roject*"], []),
+    "configured tag": (["tag0"], []),
+    "file name":      (["music_0" + exts[0]], [])
+  }
+  results["queries"] = {}
+  for name, (poss, negs) in queries.items():
+    def folders(): idx.dropCaches(); return idx.findFolders(poss, negs)  # like a single tp call
+    def files(): idx.dropCaches(); return [(path, found) for path, found in idx.search(poss, negs, jobs = jobs)]
+    fduration, fresult = timed(folders, repeat)
+    sduration, sresult = timed(files, repeat)
+    results["queries"][name] = {"terms": poss + ["-" + n for n in negs], "folders_seconds": fduration, "candidate_folders": len(fresult), "search_seconds": sduration, "found_files": sum(len(found) for path, found in sresult)}
+  return results
+
+
+def main():
+  op = optparse.OptionParser(usage = "python3 benchmarks.py [options]", description = "Benchmark tagsPlorer on a synthetic folder tree")
+  op.add_option('-d', '--depth',    action = "store",       dest = "depth",    default = 3,    type = int, help = "Folder levels, default: 3")
+  op.add_option('-f', '--fanout',   action = "store",       dest = "fanout",   default = 6,    type = int, help = "Sub-folders per folder, default: 6")
+  op.add_option('-n', '--files',    action = "store",       dest = "files",    default = 10,   type = int, help = "Files per folder, default: 10")
+  op.add_option('-e', '--exts',     action = "store",       dest = "exts",     default = ".txt,.jpg,.py,.pdf", help = "Comma-separated file extensions, default: .txt,.jpg,.py,.pdf")
+  op.add_option('-t', '--tags',     action = "store",       dest = "tags",     default = 10,   type = int, help = "Folders with configured tags, default: 10")
+  op.add_option('-m', '--mappings', action = "store",       dest = "mappings", default = 5,    type = int, help = "Folders with mapped folders, default: 5")
+  op.add_option(      '--set',      action = "append",      dest = "settings", default = [],               help = "Global configuration setting <key>=<value>, e.g. compact_index=True")
+  op.add_option(      '--seed',     action = "store",       dest = "seed",     default = 0,    type = int, help = "Random seed for the generated tree, default: 0")
+  op.add_option('-j', '--jobs',     action = "store",       dest = "jobs",     default = 1,    type = int, help = "Number of threads for scanning folders and filtering files, default: 1")
+  op.add_option('-r', '--repeat',   action = "store",       dest = "repeat",   default = 5,    type = int, help = "Repetitions for load and search timings (median), default: 5")
+  op.add_option(      '--root',     action = "store",       dest = "root",     default = None,             help = "Generate tree in this (empty or non-existing) folder and keep it, default: temporary folder")
+  op.add_option('-o', '--output',   action = "store",       dest = "output",   default = None,             help = "Write JSON results to this file, default: standard output")
+  options, args = op.parse_args()
+  exts = tuple(e.strip() for e in options.exts.split(",") if e.strip())
+  root = os.path.abspath(options.root) if options.root else tempfile.mkdtemp(prefix = "tagsplorer-bench-")
+  try:
+    parameters = {k: v for k, v in options.__dict__.items() if k not in ("root", "output")}
+    duration, tree = timed(lambda: generate(root, options.depth, options.fanout, options.files, exts, options.tags, options.mappings, options.settings, options.seed))
+    tree["seconds"] = duration
+    results = {
+      "version":    wrapExc(lambda: open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "tagsplorer", "VERSION"), encoding = "utf-8").read().strip()),
+      "python":     f"{platform.python_implementation()} {platform.python_version()}",
+      "platform":   platform.platform(),
+      "timestamp":  time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "parameters": parameters,
+      "tree":       tree,
+    }
+    results.update(benchmark(root, options.jobs, options.repeat, exts))
+  finally:
+    if not options.root: shutil.rmtree(root, ignore_errors = True)
+  data = json.dumps(results, indent = 2)
+  if options.output:
+    with open(options.output, "w", encoding = "utf-8") as fd: fd.write(data + "\n")
+  else: print(data)
+
+
+if __name__ == '__main__': main()
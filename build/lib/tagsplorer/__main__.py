@@ -0,0 +1,8 @@
+# coding=utf-8
+
+''' tagsPlorer package entry point  (C) 2021-2021  Arne Bachmann  https://github.com/ArneBachmann/tagsplorer '''
+
+from tagsplorer import tp
+
+
+tp.Main().parse_and_run()
\ No newline at end of file
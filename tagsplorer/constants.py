@@ -9,12 +9,21 @@ APPNAME = "tagsPlorer"  # or something clunky like "virtdirview"
 RIGHTS  = 0o760  # for creating new index folders (usually exist already)
 CONFIG  = ".tagsplorer.cfg"  # main user-edited configuration file
 INDEX   = ".tagsplorer.idx"  # index         file (re-built on every manual or detected file system change)
+SHDFILE = ".tagsplorer.%08x.idx"  # index shard file per configured top-level folder, named by the CRC32 of the folder name
+SHDFILES = re.compile(r"\.tagsplorer\.[0-9a-f]{8}\.idx(\.tmp)?")  # matches index shard files, also while being written
 SKPFILE = ".tagsplorer.skp"  # skip   marker file (could equally be configured in configuration instead)
 IGNFILE = ".tagsplorer.ign"  # ignore marker file (could equally be configured in configuration instead)
-IGNORE, SKIP, TAG, FROM, SKIPD, IGNORED, GLOBAL = "ignore", "skip", "tag", "from", "skipd", "ignored", "global"  # allowed config file options
+IGNORE, SKIP, TAG, FROM, SKIPD, IGNORED, GLOBAL, SHARD = "ignore", "skip", "tag", "from", "skipd", "ignored", "global", "shard"  # allowed config file options
 NL, COMB, SEPA, SLASH, DOT, ALL, ST_MTIME, ST_SIZE = "\n", ",", ";", "/", os.extsep, "*", 8, 6  # often-used constants
 TOKENIZER = re.compile(r"[\s\-_\.!\?#,]+")  # tokenize file names as additional tags
 PICKLE_PROTOCOL = 4  # (Python V3.4+) for pypy3 compatibility
+MAPPED_MAGIC = b"tPlrIdx3"  # leading bytes of memory-mapped index files, to distinguish them from pickled ones
+CODEC_MAGIC = b"tPlrCdc1"  # leading bytes of serialized index files, followed by the codec specification line. files without magic are zlib-compressed or plain pickles
+INDEX_READ_RATE = 100.  # MB/s. assumed index file read throughput when selecting the index codec automatically (tp -U --index-codec auto[:<MB/s>])
+MTIME_SLACK = 2 * 10 ** 9  # nanoseconds. folders modified this recently before a walk are always re-scanned next time (coarse file system time stamps like FAT)
+SERVE_PORT = 24411  # default localhost port for the resident query server (tp --serve)
+WATCH_DELAY, WATCH_POLL, WATCH_FLUSH = 0.5, 10., 60.  # seconds. tp --watch: collect bursts of file system events, poll interval without inotify, minimum interval between index stores
+FEDERATE_WAIT = 0.2  # seconds. tp --federate: interval for checking whether searching processes ended without reporting back
 SKIPDS   = [".git", ".svn", "$RECYCLE.BIN", "System Volume Information"]
 IGNOREDS = []
 
@@ -0,0 +1,108 @@
+# coding=utf-8
+
+''' tagsPlorer search across several indexed roots  (C) 2021-2021  Arne Bachmann  https://github.com/ArneBachmann/tagsplorer '''
+
+import logging, multiprocessing, os, queue, sys
+
+from tagsplorer.constants import FEDERATE_WAIT, INDEX, NL
+from tagsplorer.lib import Indexer
+from tagsplorer.utils import normalizer, sjoin
+
+
+_log = logging.getLogger(__name__)
+def log(level): return (lambda *s: _log.isEnabledFor(level) and _log.log(level, sjoin([_() if callable(_) else _ for _ in s]), **({"stacklevel": 2} if sys.version_info >= (3, 8) else {})))  # callable arguments are only evaluated if the level is enabled
+debug, info, warn, error = log(logging.DEBUG), log(logging.INFO), log(logging.WARNING), log(logging.ERROR)
+
+
+def readRegistry(filename):
+  ''' Read a registry file that lists one root per line: an indexed root folder, or ":<port>" of a running "tp --serve".
+      Empty lines and lines starting with # are ignored. Relative folders are relative to the registry file's folder.
+      returns: list of entries
+  '''
+  base = os.path.dirname(os.path.abspath(filename))
+  with open(filename, encoding = "utf-8") as fd: lines = [line.strip() for line in fd.read().split(NL)]
+  return [line if line[:1] == ":" else os.path.join(base, os.path.expanduser(line)) for line in lines if line and line[0] != "#"]
+
+
+def resolveRoots(args):
+  ''' Expand the arguments of --federate into root entries.
+      args:    root folders, ":<port>" entries and registry files
+      returns: list of absolute root folders and ":<port>" entries, without duplicates
+  '''
+  entries = []
+  for arg in args:
+    for entry in (readRegistry(arg) if os.path.isfile(arg) else [arg]):
+      entry = entry if entry[:1] == ":" else os.path.abspath(os.path.expanduser(entry))
+      if entry not in entries: entries.append(entry)
+  return entries
+
+
+def searchRoot(number, entry, poss, negs, results, onlyfolders = False, ignore_case = False, keep_index = False, jobs = 1, limit = None):
+  ''' Search one root, run in its own process to use the root's case_sensitive setting for the (module-global) case normalizer.
+      number:  position of the entry, to identify the results
+      entry:   absolute root folder, or ":<port>" of a running server
+      results: queue that receives 3-tuple(number, absolute folder path, list of file names) per found folder, and finally (number, None, error message or None)
+  '''
+  try:
+    if entry[:1] == ":":
+      from tagsplorer.serve import query
+      result = query(int(entry[1:]), poss + ["-" + n for n in negs], onlyfolders = onlyfolders, ignore_case = ignore_case, limit = limit)
+      for path in result.get("folders", []): results.put((number, result["root"] + path, []))
+      for path, files in result.get("files", []): results.put((number, result["root"] + path, files))
+    else:
+      if not os.path.exists(os.path.join(entry, INDEX)): raise FileNotFoundError(f"No index file found. Run 'tp -U -r {entry}' first")
+      idx = Indexer(entry)
+      idx.load(os.path.join(entry, INDEX), ignore_skew = keep_index, jobs = jobs)  # may re-create and store the index
+      normalizer.setupCasematching(not (ignore_case or not idx.cfg.case_sensitive), suppress = True)
+      poss, negs = map(lambda l: list(map(normalizer.filenorm, l)), (poss, negs))
+      for path, files in idx.search(poss, negs, onlyfolders = onlyfolders, jobs = jobs, limit = limit):
+        if onlyfolders: results.put((number, idx.root + path, []))
+        elif files:     results.put((number, idx.root + path, list(files)))
+    results.put((number, None, None))
+  except Exception as E: results.put((number, None, str(E) or E.__class__.__name__))
+
+
+class Federation(object):
+  ''' Search several indexed roots at once, cf. "tp --federate".
+      Each root is loaded and searched in a separate process (or queried from its running server), so that all roots are processed concurrently while each keeps its own case_sensitive setting.
+      Found folders are merged in the order of their arrival, with absolute paths.
+  '''
+
+  def __init__(_, entries, keep_index = False, jobs = 1):
+    ''' entries:    absolute root folders, or ":<port>" of running servers, cf. resolveRoots()
+        keep_index: if True, don't re-create indexes on configuration changes, cf. --keep-index
+        jobs:       number of threads per root for re-creating the index and filtering files
+    '''
+    _.entries, _.keep_index, _.jobs = entries, keep_index, jobs
+    _.failed = []  # entries that could not be searched
+
+  def search(_, poss, negs, onlyfolders = False, ignore_case = False, limit = None):
+    ''' Search all roots like "tp <tags>".
+        limit:   maximum number of files (or folders if onlyfolders) to return in total
+        returns: generator of 2-tuple(absolute folder path, list of file names), with empty lists if onlyfolders
+    '''
+    _.failed = []
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target = searchRoot, args = (number, entry, poss, negs, results), kwargs = {"onlyfolders": onlyfolders, "ignore_case": ignore_case, "keep_index": _.keep_index, "jobs": _.jobs, "limit": limit}, daemon = True) for number, entry in enumerate(_.entries)]
+    for worker in workers: worker.start()
+    debug(f"Search {len(workers)} roots")
+    done, found = set(), 0
+    try:
+      while len(done) < len(workers) and (limit is None or found < limit):
+        try: number, path, files = results.get(timeout = FEDERATE_WAIT)
+        except queue.Empty:
+          for number, worker in enumerate(workers):  # a process that ended has sent all its results
+            if number not in done and not worker.is_alive() and results.empty(): done.add(number); _.failed.append(_.entries[number]); error(f"Search in '{_.entries[number]}' ended unexpectedly")
+          continue
+        if path is None:
+          done.add(number)
+          if files is not None: _.failed.append(_.entries[number]); error(f"Search in '{_.entries[number]}' failed: {files}")
+          continue
+        if limit is not None and not onlyfolders: files = files[:limit - found]
+        found += 1 if onlyfolders else len(files)
+        yield path, files
+    finally:
+      for worker in workers:
+        if worker.is_alive(): worker.terminate()  # after reaching the limit, or when interrupted
+        worker.join()
+      results.close()
@@ -2,16 +2,19 @@
 
 ''' tagsPlorer library  (C) 2016-2021  Arne Bachmann  https://github.com/ArneBachmann/tagsplorer '''
 
-import logging, os, pickle, sys, zlib
+import heapq, logging, os, pickle, re, sys, time, types, zlib
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from functools import reduce
 
-from tagsplorer.constants import ALL, COMB, CONFIG, DOT, FROM, GLOBAL, IGNFILE, IGNORE, IGNORED, ON_WINDOWS, PICKLE_PROTOCOL, SEPA, SKIP, SKIPD, SKPFILE, SLASH, ST_MTIME, ST_SIZE, TAG, TOKENIZER
-from tagsplorer.utils import anyParentIsSkipped, appendnew, dd, dictGet, dictGetSet, findIndexOrAppend, getTsMs, isDir, isFile, isGlob, lappend, normalizer, pathHasGlobalIgnore, pathHasGlobalSkip, pathNorm, safeSplit, sjoin, splitByPredicate, wrapExc, xall, xany
+from tagsplorer.constants import ALL, COMB, CONFIG, DOT, FROM, GLOBAL, IGNFILE, IGNORE, IGNORED, INDEX, INDEX_READ_RATE, MAPPED_MAGIC, MTIME_SLACK, ON_WINDOWS, SEPA, SHARD, SHDFILE, SHDFILES, SKIP, SKIPD, SKPFILE, SLASH, ST_MTIME, ST_SIZE, TAG, TOKENIZER
+from tagsplorer.structures import IndexCodec, MappedIndex, Postings, StringTable, bitCount, bitsToIds, globTrigrams, idsToBits, nameTrigrams
+from tagsplorer.utils import appendnew, dd, dictGet, dictGetSet, findIndexOrAppendIndexed, getTsMs, globToRegex, isDir, isFile, isGlob, lappend, metrics, normalizer, orderedMap, pathNorm, safeRSplit, safeSplit, sjoin, splitByPredicate, wrapExc, xall, xany
 
 
 _log = logging.getLogger(__name__)
-def log(func): return (lambda *s: func(sjoin([_() if callable(_) else _ for _ in s]), **({"stacklevel": 2} if sys.version_info >= (3, 8) else {})))
-debug, info, warn, error = log(_log.debug), log(_log.info), log(_log.warning), log(_log.error)
+def log(level): return (lambda *s: _log.isEnabledFor(level) and _log.log(level, sjoin([_() if callable(_) else _ for _ in s]), **({"stacklevel": 2} if sys.version_info >= (3, 8) else {})))  # callable arguments are only evaluated if the level is enabled
+debug, info, warn, error = log(logging.DEBUG), log(logging.INFO), log(logging.WARNING), log(logging.ERROR)
 
 
 class ConfigParser(object):  # TODO #89 is there a faster serialization protocol?
@@ -35,7 +38,7 @@ class ConfigParser(object):  # TODO #89 is there a faster serialization protocol
           idx = line.index('=')  # try to parse
           key, value = line[:idx].lower(), line[idx+1:]  # HINT: was .lower().rstrip(), but when accessing only via this script's API there's no need for that
           if value != '' and (key in [TAG, FROM]\
-          or title == "" and  key in [SKIPD, IGNORED, GLOBAL]): section[key].append(value)  # allows several values per key
+          or title == "" and  key in [SKIPD, IGNORED, GLOBAL, SHARD]): section[key].append(value)  # allows several values per key
           elif key in [IGNORE, SKIP] and key not in section:    section[key] = None  # only keep key as marker
           else: warn(f"Encountered illegal configuration key '{key}'. Skip entry")
         except: warn(f"Key without value for illegal key '{line}'")
@@ -52,7 +55,7 @@ class ConfigParser(object):  # TODO #89 is there a faster serialization protocol
       if "" not in _.sections: _.sections[""] = dd()
       _.sections[""][GLOBAL] = sorted([f"{k.lower()}={parent.__dict__[k]}" for k, v in (kv.split("=")[:2] for kv in _.sections.get("", {}).get(GLOBAL, []))])  # store updated config
     for title, _map in sorted(_.sections.items()):  # ordered is better for VCS
-      if len(_map) == 0 or xall(lambda v: len(v) == 0, _map.values()): continue
+      if len(_map) == 0 or xall(lambda v: v is not None and len(v) == 0, _map.values()): continue
       fd.write(f"[{title}]\n")
       for key, values in sorted(_map.items()):  # no need for iteritems, as supposedly small (max. size = 4)
         if values is None: fd.write(f"{key}=\n")  # skip or ignore
@@ -73,12 +76,25 @@ class Configuration(object):
     _.case_sensitive = (not ON_WINDOWS) if case_sensitive is None else case_sensitive  # search behavior
     _.reduce_storage = False           # storage behavior
     _.compression = 2                  # good fast compromise: uncompressed pickling is faster than any bz2 compression, but zlib level 2 seems to get best trade-off. 0 means uncompressed
+    _.compact_index = False            # memory behavior: store the index in flat arrays instead of lists and sets
+    _.mapped_index = False             # storage behavior: write the index in a format that is memory-mapped on load, instead of unpickling it entirely
+    _.index_files = False              # storage behavior: also index file names and their tokens, not only folder names and file extensions
+    _.verify_case = False              # search behavior: check the letter case of found folders on disk, instead of trusting the index
+    _.index_codec = None               # storage behavior: serialization and compression of the index file, cf. IndexCodec. None means zlib at the 'compression' level
+
+  def indexCodec(_):
+    ''' Codec for storing the index, unless memory-mapped. '''
+    return IndexCodec(_.index_codec or (f"zlib:{_.compression}" if int(_.compression) else "pickle"))
 
   def logConfiguration(_):
     ''' Display debug info. '''
     info("Configuration:  " + "  ".join(f"{k}: %s" % ("On" if v else "Off") for k, v in [
         ("case_sensitive",  _.case_sensitive),
         ("reduce_storage",  _.reduce_storage),
+        ("compact_index",   _.compact_index),
+        ("mapped_index",    _.mapped_index),
+        ("index_files",     _.index_files),
+        ("verify_case",     _.verify_case),
         ("on_windows",      ON_WINDOWS)
       ]))
 
@@ -88,7 +104,7 @@ class Configuration(object):
         index_ts: timestamp from inside the index file, or None (force load)
         returns:  False if index is still current, otherwise True (configuration loaded and a new index must be created)
     '''
-    with open(os.path.join(folder, CONFIG), 'r', encoding = "utf-8") as fd:
+    with open(os.path.join(folder, CONFIG), 'r', encoding = "utf-8") as fd, metrics.phase("config_load"):
       timestamp = float(fd.readline().rstrip())
       file_time = int(os.stat(os.path.join(folder, CONFIG))[ST_MTIME] * 1000)
       if index_ts and max(timestamp, file_time) == index_ts:
@@ -164,6 +180,50 @@ class Configuration(object):
     for key, defs in sorted(tags.items()): print("\n".join(defs))
 
 
+def folderStamp(folder, skp, ign):
+  ''' Modification signature of a folder and its marker files, used to detect changes since the last walk.
+      folder:  absolute folder path
+      skp:     does the folder contain a skip marker file?
+      ign:     does the folder contain an ignore marker file?
+      returns: 3-tuple(folder modification time, skip marker modification time or None, ignore marker modification time or None) in nanoseconds
+  '''
+  metrics.count("stat_calls", 1 + bool(skp) + bool(ign))
+  return (os.stat(folder).st_mtime_ns,
+          os.stat(folder + SLASH + SKPFILE).st_mtime_ns if skp else None,
+          os.stat(folder + SLASH + IGNFILE).st_mtime_ns if ign else None)
+
+
+class TagRule(object):
+  ''' A folder's configured tag rule "<tag>;<includes>;<excludes>", pre-split and with its globs compiled for the current case matching mode, cf. Indexer.tagRules(). '''
+
+  __slots__ = ("includes", "excludes")
+
+  def __init__(_, value):
+    assert value.count(SEPA) == 2
+    tg, inc, exc = value.split(SEPA)  # tag name, includes, excludes
+    compile = lambda p: (p, normalizer.filenorm(p), None) if p[0] == DOT else (p, None, normalizer.globregex(p).match if isGlob(p) else None)  # 3-tuple(pattern, normalized extension, glob matcher)
+    _.includes = [compile(i) for i in safeSplit(inc) if i != ALL]  # keep all, nothing to do
+    _.excludes = [compile(e) for e in safeSplit(exc)]
+
+  @staticmethod
+  def select(patterns, names, exists, normalized = False):
+    ''' Reduce file names to the conjunction of all patterns.
+        exists:     function that checks if a file name exists in the folder
+        normalized: compare file extensions case-normalized
+    '''
+    for pattern, ext, match in patterns:
+      if not names: break
+      if ext is not None: names = set(f for f in names if normalizer.filenorm(f[-len(pattern):]) == ext) if normalized else set(f for f in names if f[-len(pattern):] == pattern)
+      elif match:         names = set(f for f in names if match(f))
+      else:               names = set([pattern]) if pattern in names and exists(pattern) else set()  # add file only if exists
+    return names
+
+  def apply(_, names, exists, normalized = False):
+    ''' returns: subset of file names matched by the includes, but not by the excludes (no excludes mean remove nothing) '''
+    found = TagRule.select(_.includes, set(names), exists, normalized)
+    return found - TagRule.select(_.excludes, found, exists, normalized) if _.excludes and found else found
+
+
 class Indexer(object):
   ''' Main index creation. Walks through file tree and indexes folder tags.
       Addtionally, tags for single files or globs, and those mapped by FROM markers are included in the index.
@@ -184,56 +244,193 @@ class Indexer(object):
     _.tagdirs = None       # array of tags (folder names and manually set tags (not represented in parent), both case-normalized and as-is) WARN do not try to convert into a dict! It contains duplicates on purpose
     _.tagdir2parent = None # index of dir entry (tagdirs) -> index of parent to represent tree structure (excluding folder links)
     _.tagdir2paths = dd()  # dirname/tag index -> list of [all path indices relevant for that dirname/tag]
+    _.name2tagdir = {}     # dirname/tag -> first index in tagdirs, for constant-time lookup of tags
+    _.name2tagdirs = {}    # dirname/tag -> list of all indices in tagdirs
+    _.trigrams = {}        # three-letter substring of the lower-case names -> sorted array of first indices in tagdirs of all names containing it, to pre-select names for glob matching
+    _.scans = {}           # root-relative folder path -> 6-tuple(modification stamp or None, file extensions, sub-folder names, skip marker?, ignore marker?, file names or None) for incremental walks
+    _.mapped = None        # memory-mapped index file the structures above are backed by, if loaded from one. In that case scans are decoded only on demand
+    _.tagged = None        # configured tag name -> sorted folder indices in its posting list only due to configured tags or folder mappings, to apply configuration changes without walking
+    _.shard = None         # top-level folder name, if this index is the shard for that folder's tree
+    _.shards = None        # manifest of a sharded index: top-level folder name -> frozenset of all names indexed in its shard. this index then covers the root folder and all other top-level folders
+    _.shardIndexes = {}    # top-level folder name -> shard Indexer, loaded on demand
+    _.pending = set()      # names of walked shards not yet stored
+    _.meta = None          # folder of the index file, once loaded or stored, for locating the shard files
 
-  def load(_, filename, ignore_skew = False, recreate_index = False):
+  def load(_, filename, ignore_skew = False, recreate_index = False, jobs = 1):
     ''' Load a pickled index into memory. Optimized for speed.
         filename: absolute path to the index file
         ignore_skew:    if True, ignore the fact that index and config timestamps deviate. used in tests and for --keep-index
         recreate_index: if True, create a new index even if timestamps still match
+        jobs:           number of worker threads for scanning folders, if the index needs to be re-created
     '''
     debug(f"load('{filename}': ignore_skew %s, recreate_index %s)" % ("Yes" if ignore_skew else "No", "Yes" if recreate_index else "No"))
-    try: del _.allPaths  # cache flag used when run as a web server
-    except AttributeError: pass  # delete cache when reloading
-    with open(filename, "rb") as fd:
-      info("Read index from " + filename)
-      c = pickle.loads(wrapExc(lambda: zlib.decompress(fd.read()), fd.read))
-      _.cfg, _.timestamp, _.tagdirs, _.tagdir2parent, _.tagdir2paths = c.cfg, c.timestamp, c.tagdirs, c.tagdir2parent, c.tagdir2paths
-      cfg = Configuration(_.cfg.case_sensitive)
-      if (recreate_index or cfg.load(os.path.dirname(os.path.abspath(filename)), _.timestamp)) and not ignore_skew:
+    _.read(filename)
+    cfg = Configuration(_.cfg.case_sensitive)
+    for k, v in cfg.__dict__.items(): _.cfg.__dict__.setdefault(k, v)  # add settings unknown when the index was created
+    if (recreate_index or cfg.load(os.path.dirname(os.path.abspath(filename)), _.timestamp)) and not ignore_skew:
+      if recreate_index:
         info("Recreate index considering configuration")
+        _.cfg = cfg
+        _.walk(jobs = jobs)
+      elif not _.applyConfiguration(cfg):  # only configured tags or folder mappings changed: update their posting lists only
+        info("Update index considering configuration")
         _.cfg = cfg  # set more recent config and update
-        _.walk()  # re-create this index
-        _.store(filename)
-      else: normalizer.setupCasematching(_.cfg.case_sensitive, suppress = not recreate_index)  # update with just loaded setting
+        _.walk(incremental = True, jobs = jobs)  # re-assemble this index from the folder listings, scanning only modified folders and those not yet listed (e.g. no longer skipped)
+      _.store(filename)
+    else: normalizer.setupCasematching(_.cfg.case_sensitive, suppress = not recreate_index)  # update with just loaded setting
+
+  def read(_, filename):
+    ''' Read the index structures from a file, without checking the configuration or changing the case matching mode. May run on a worker thread.
+        filename: absolute path to the index file
+    '''
+    _.dropCaches()  # delete search caches when reloading
+    _.meta, _.shardIndexes, _.pending = os.path.dirname(os.path.abspath(filename)), {}, set()
+    with open(filename, "rb") as fd:
+      info("Read index from " + filename)
+      if fd.read(len(MAPPED_MAGIC))[:-1] == MAPPED_MAGIC[:-1]:  # memory-mapped index: decode only what queries access. last byte is the format version
+        with metrics.phase("map"): c = _.mapped = MappedIndex(fd)
+        _.scans = None  # decoded on demand
+      else:
+        fd.seek(0)
+        codec = IndexCodec.read(fd)  # None for indexes created by older versions
+        raw = fd.read()
+        with metrics.phase("decompress"): data = codec.decompress(raw) if codec else wrapExc(lambda: zlib.decompress(raw), raw)  # uncompressed if compression was disabled
+        with metrics.phase("un" + (codec.serializer if codec else "pickle")): c = codec.deserialize(data) if codec else pickle.loads(data)
+        if codec and codec.serializer == "marshal": c = Indexer.fromPlain(c)
+        _.mapped, _.scans = None, wrapExc(lambda: c.scans, {})  # indexes created by older versions have no folder listings
+    _.cfg, _.timestamp, _.tagdirs, _.tagdir2parent, _.tagdir2paths = c.cfg, c.timestamp, c.tagdirs, c.tagdir2parent, c.tagdir2paths
+    try: _.name2tagdir, _.name2tagdirs = c.name2tagdir, c.name2tagdirs
+    except AttributeError: _.indexNames()  # created by older versions
+    _.trigrams = wrapExc(lambda: c.trigrams, None)  # created by older versions: globs are matched against all names
+    _.aliases = wrapExc(lambda: c.aliases, None)  # created by older versions: letter cases are checked on disk
+    _.tagged = wrapExc(lambda: c.tagged, None)  # created by older versions or memory-mapped: configuration changes require a walk
+    _.shard, _.shards = wrapExc(lambda: c.shard, None), wrapExc(lambda: c.shards, None)  # not sharded if created by older versions
 
   def store(_, filename, config_too = True):
-    ''' Persist index in a file, including currently active configuration. '''
-    with open(filename, "wb") as fd:
+    ''' Persist index in a file, including currently active configuration. Walked shards are stored into their own files next to it. '''
+    _.meta = os.path.dirname(os.path.abspath(filename))
+    for name in sorted(_.pending): _.shardIndexes[name].store(_.shardFile(name), config_too = False)
+    _.pending = set()
+    if _.shard is None:  # remove shard files of top-level folders no longer sharded
+      current = set(os.path.basename(_.shardFile(name)) for name in _.shards or ())
+      for f in os.listdir(_.meta):
+        if SHDFILES.fullmatch(f) and f not in current: debug(f"Remove index shard file {f}"); wrapExc(lambda: os.unlink(os.path.join(_.meta, f)))
+    with open(filename + ".tmp", "wb") as fd:  # replaced afterwards, as a memory-mapped index file may still be in use
       nts = getTsMs()
       _.timestamp = _.timestamp + 0.001 if nts <= _.timestamp else nts  # assign new date, ensure always differing from old value
-      debug("Store index to " + filename)
-      fd.write(zlib.compress(pickle.dumps(_, protocol = PICKLE_PROTOCOL), _.cfg.compression) if _.cfg.compression else pickle.dumps(_, protocol = PICKLE_PROTOCOL))
-      if config_too:
-        debug("Update configuration to match new index timestamp")
-        _.cfg.store(os.path.dirname(os.path.abspath(filename)), _.timestamp)  # update timestamp in configuration
+      debug("Store index to " + filename + (" in memory-mapped format" if _.cfg.mapped_index and not _.shards else ""))
+      if _.cfg.mapped_index and not _.shards:  # the memory-mapped format has no manifest. the shards themselves are memory-mapped
+        with metrics.phase("write_mapped"): MappedIndex.write(fd, _.cfg, _.timestamp, _.tagdirs, _.tagdir2parent, _.tagdir2paths, _.name2tagdirs, _.trigrams, _.aliases, _.getScans(), _.cfg.compression)
+      else:
+        _.dropCaches()  # search caches are re-computed on demand instead of being stored
+        codec = _.cfg.indexCodec()
+        with metrics.phase(codec.serializer): data = codec.serialize(_ if codec.serializer == "pickle" else _.plain())
+        with metrics.phase("compress"): data = codec.compress(data)
+        fd.write(codec.header()); fd.write(data)
+    os.replace(filename + ".tmp", filename)
+    if config_too:
+      debug("Update configuration to match new index timestamp")
+      _.cfg.store(os.path.dirname(os.path.abspath(filename)), _.timestamp)  # update timestamp in configuration
     info(f"Wrote {os.stat(filename)[6]} index bytes ({len(_.tagdirs)} entries and %d paths)" % (sum([len(p) for p in _.tagdir2paths])))
 
-  def walk(_, cfg = None):
+  def __getstate__(_):
+    ''' Loaded shards are stored in their own files, not pickled along. '''
+    return {k: v for k, v in _.__dict__.items() if k not in ("shardIndexes", "pending", "meta")}
+
+  def plain(_):
+    ''' Index contents as built-in types only, as required by the marshal codec. Integer arrays are stored as bytes in the writing machine's byte order. '''
+    ints = lambda values: (values if isinstance(values, array) else array('I', values)).tobytes()
+    compact = isinstance(_.tagdirs, StringTable)
+    return {
+      "byteorder":     sys.byteorder,
+      "cfg":           {k: v if k != "paths" else {path: dict(markers) for path, markers in v.items()} for k, v in _.cfg.__dict__.items()},
+      "timestamp":     _.timestamp,
+      "compact":       compact,
+      "tagdirs":       (ints(_.tagdirs.offsets), bytes(_.tagdirs.data)) if compact else list(_.tagdirs),
+      "tagdir2parent": ints(_.tagdir2parent) if compact else list(_.tagdir2parent),
+      "tagdir2paths":  (ints(_.tagdir2paths.offsets), ints(_.tagdir2paths.values)) if compact else list(_.tagdir2paths),
+      "name2tagdir":   _.name2tagdir,
+      "name2tagdirs":  _.name2tagdirs,
+      "trigrams":      {gram: ints(ids) for gram, ids in _.trigrams.items()} if _.trigrams is not None else None,
+      "aliases":       ints(_.aliases) if _.aliases is not None else None,
+      "tagged":        _.tagged,
+      "shard":         _.shard,
+      "shards":        _.shards,
+      "scans":         _.getScans()
+    }
+
+  @staticmethod
+  def fromPlain(plain):
+    ''' Re-create index contents from plain(), with the same attributes as an unpickled index. '''
+    def ints(data):
+      values = array('I'); values.frombytes(data)
+      if plain["byteorder"] != sys.byteorder: values.byteswap()
+      return values
+    cfg = Configuration.__new__(Configuration)  # without side effects on the normalizer, like unpickling
+    cfg.__dict__.update(plain["cfg"])
+    cfg.paths = {}
+    for path, markers in plain["cfg"]["paths"].items(): dictGetSet(cfg.paths, path, dd()).update(markers)
+    c = types.SimpleNamespace(cfg = cfg, timestamp = plain["timestamp"], name2tagdir = plain["name2tagdir"], name2tagdirs = plain["name2tagdirs"], scans = plain["scans"], tagged = plain.get("tagged"), shard = plain.get("shard"), shards = plain.get("shards"))
+    c.trigrams = {gram: ints(ids) for gram, ids in plain["trigrams"].items()} if plain["trigrams"] is not None else None
+    c.aliases  = (ints(plain["aliases"]) if plain["compact"] else list(ints(plain["aliases"]))) if plain["aliases"] is not None else None
+    if plain["compact"]:
+      c.tagdirs       = StringTable.fromBuffers(ints(plain["tagdirs"][0]), plain["tagdirs"][1])
+      c.tagdir2parent = ints(plain["tagdir2parent"])
+      c.tagdir2paths  = Postings.fromBuffers(ints(plain["tagdir2paths"][0]), ints(plain["tagdir2paths"][1]))
+    else: c.tagdirs, c.tagdir2parent, c.tagdir2paths = plain["tagdirs"], plain["tagdir2parent"], plain["tagdir2paths"]
+    return c
+
+  def selectCodec(_, rate = INDEX_READ_RATE):
+    ''' Benchmark index codecs on the current index contents and choose the one with the shortest expected load time, cf. IndexCodec.select(). '''
+    _.dropCaches()
+    codec, results = IndexCodec.select({"pickle": _, "marshal": _.plain()}, rate)
+    for spec, size, seconds, expected in results: info(f"Index codec {spec:<16} {size:>10} bytes, decoded in {seconds * 1000:.1f}ms, expected load time {expected * 1000:.1f}ms")
+    return codec
+
+  def walk(_, cfg = None, incremental = False, jobs = 1, changed = None):
     ''' Build index by recursively traversing the folder tree.
         cfg: if set, use that configuration instead of the one in the root.
+        incremental: if True, re-use the folder listings of the previous walk for all folders whose modification stamp didn't change
+        jobs: if larger than 1, scan folders on that many worker threads first, then build the index from their listings in walk order
+        changed: if set, re-use the previous walk's listings without checking any modification stamps, except for these root-relative folders known to be modified (from file system notifications). implies incremental
+        returns: number of re-scanned folders
     '''
-    info("Walk folder tree to update index")
+    incremental = incremental or changed is not None
+    info("Walk folder tree to update index" + (" incrementally" if incremental else ""))
     if cfg: _.cfg = cfg
     if _.cfg is None: raise Exception("No configuration loaded. Cannot traverse folder tree")
     debug(f"Configuration: case_sensitive = {_.cfg.case_sensitive}, reduce_storage = {_.cfg.reduce_storage}")
     _.tagdirs = [""]       # list of directory names, duplicates allowed and required to represent the tree structure. "" represents the root folder
     _.tagdir2parent = [0]  # pointer to parent directory. the self-reference at index 0 marks root. each index position responds to one entry in tagdirs (!)
     _.tagdir2paths = dd()  # maps index of tagdir entries to list of path leaf indexes, to find all paths ending in that suffix HINT stored as list-of-sets after processing
+    _.name2tagdir = {"": 0}    # maps tagdirs entries to their first index
+    _.name2tagdirs = {"": [0]} # maps tagdirs entries to all their indices
+    _.trigrams = {}            # built after walking
+    _.aliases = []             # indices of case-normalized copies of folder names, which don't exist on disk
     _.tags = []            # temporary data structure for "set" of (manually set or folder-derived) tag names and file extensions, which gets mapped into the tagdirs structure
-    _.tag2paths = dd()     # temporary data structure for config-specified tag and extension mapping to matching respective paths
+    _.tag2index = {}       # temporary data structure for constant-time lookup of tags
+    _.tag2paths = dd()     # temporary data structure for extension, file name and folder token mapping to matching respective paths
+    _.configured = dd()    # temporary data structure for config-specified tag and folder mapping to matching respective paths
+    _.oldscans = _.getScans() if incremental else {}  # temporary data structure with folder listings of the previous walk
+    _.changed = changed    # temporary data structure with folders whose listings cannot be re-used
+    _.scans = {}
+    _.mapped = None        # all structures are re-built, the memory-mapped file is unmapped once no longer referenced
+    _.started = int(time.time() * 1e9)  # nanoseconds, to detect folders modified during the walk
+    _.rescanned = 0
+    _.dropCaches()
+    names = _.shardFolders() if _.shard is None else []  # top-level folders indexed in their own shards
+    _.shards, _.shardIndexes, _.pending = dict.fromkeys(names) or None, {name: _.shardIndexes[name] for name in names if name in _.shardIndexes}, _.pending & set(names)
 
-    _._walk(_.root, 0)     # recursive indexing
-    _.mapTagsIntoDirsAndCompressIndex()  # manual tags are combined in the index with folder names for faster lookup and filtering
+    with ThreadPoolExecutor(max_workers = 1) as pool:  # shards are walked alongside this index
+      sharded = pool.submit(_.walkShards, names, incremental, jobs, changed) if names else None
+      with metrics.phase("walk"):
+        _.prefetched = _.prefetch(jobs) if jobs > 1 else {}  # temporary data structure with folder listings from worker threads
+        _._walk(_.root, 0)   # recursive indexing
+      info(f"Scanned {_.rescanned} of {len(_.scans)} folders" + (f" of shard '{_.shard}'" if _.shard is not None else ""))
+      rescanned = _.rescanned + (sharded.result() if sharded else 0)
+    del _.oldscans, _.changed, _.started, _.rescanned, _.prefetched
+    with metrics.phase("map_tags"): _.mapTagsIntoDirsAndCompressIndex()  # manual tags are combined in the index with folder names for faster lookup and filtering
+    return rescanned
 
   def _walk(_, folder, findex, tags = None, last = 0):
     ''' Recursive traversal through folder tree.
@@ -246,115 +443,322 @@ class Indexer(object):
         last:    number of last indexes used to store the current folder (1 if normalized only ot reduced storage, otherwise 2, 0 if ignored)
         returns: interrupted
     '''
-    debug(f"_walk '{folder}' findex {findex} {last} {tags}")
+    debug(lambda: f"_walk '{folder}' findex {findex} {last} {tags}")
     if tags is None: tags = []  # because using default `= []` is a bad idea in Python
     ignore = False  # marks folder as "no tagging for this specific folder", according to local or global settings
     adds = set()    # for display only: indexes of additional tags valid for the current folder only, not to be promoted to children calls
 
     # 1.  get folder configuration, if any
     marks = _.cfg.paths.get(folder[len(_.root):], {})  # contains configuration for current folder, if any
+    own = _.shard is None or findex != 0  # the root folder's tags and files belong to the root index, not to shards
     # 1a. check skip or ignore flags from configuration
-    if SKIP   in marks or xany(lambda ignore: normalizer.globmatch(folder[folder.rindex(SLASH) + 1:] if folder and SLASH in folder else folder, ignore), dictGet(dictGet(_.cfg.paths, '', {}), SKIPD, [])):
-      info(f"Skip '{folder[len(_.root):]}' due to " + ('path skip' if SKIP in marks else 'global folder name skip'))
+    if SKIP   in marks or _.globalMatch(folder, SKIPD):
+      info(lambda: f"Skip '{folder[len(_.root):]}' due to " + ('path skip' if SKIP in marks else 'global folder name skip'))
       return  # completely ignore sub-tree and break recursion
-    if IGNORE in marks or xany(lambda ignore: normalizer.globmatch(folder[folder.rindex(SLASH) + 1:] if folder and SLASH in folder else folder, ignore), dictGet(dictGet(_.cfg.paths, '', {}), IGNORED, [])):
-      info(f"Ignore '{folder[len(_.root):]}' due to " + ('path ignore' if IGNORE in marks else 'global folder name ignore'))
+    if IGNORE in marks or _.globalMatch(folder, IGNORED):
+      info(lambda: f"Ignore '{folder[len(_.root):]}' due to " + ('path ignore' if IGNORE in marks else 'global folder name ignore'))
       ignore = True  # ignore this directory as a tag, and don't index its contents, but still continue recursion
     # 1b. read configured additional tags for folder and folder mapping from configuration into "tags" and "adds"
-    elif TAG in marks:  # neither SKIP nor IGNORE in config: consider manual folder tagging
+    elif TAG in marks and own:  # neither SKIP nor IGNORE in config: consider manual folder tagging
       for t in marks[TAG]:
         tag, pos, neg = t.split(SEPA)  # tag name, includes, excludes
-        info(f"Tag <{tag}> (+<{pos}> -<{neg}>) in '{folder[len(_.root):]}'")
-        i = findIndexOrAppend(_.tags, tag); adds.add(i)  # find existing index of that tag, or create return new index
-        appendnew(_.tag2paths[i], findex)  # add tag and create link to the current folder ("tag" is a match for the current folder?)
-    if FROM in marks:  # consider tags from mapped folders, even if proper folder is ignored
+        info(lambda: f"Tag <{tag}> (+<{pos}> -<{neg}>) in '{folder[len(_.root):]}'")
+        i = findIndexOrAppendIndexed(_.tags, _.tag2index, tag); adds.add(i)  # find existing index of that tag, or create return new index
+        appendnew(_.configured[i], findex)  # add tag and create link to the current folder ("tag" is a match for the current folder?)
+    if FROM in marks and own:  # consider tags from mapped folders, even if proper folder is ignored
       for f in marks[FROM]:  # map configured tags, even if it contains an ignored marker
-        info(f"Map from '{f}' into '{folder[len(_.root):]}'")
+        info(lambda: f"Map from '{f}' into '{folder[len(_.root):]}'")
         other = os.path.normpath(os.path.join(folder, pathNorm(f)))[len(_.root):] if not f.startswith(SLASH) else pathNorm(f)
         _marks = _.cfg.paths.get(other, {})  # marks of mapped folder
         for t in _marks.get(TAG, []):
           tag, pos, neg = t.split(SEPA)  # HINT the actual pattern filtering is implemented in findFiles
-          info(f"Tag <{tag}> (+<{pos}> -<{neg}>) in '{folder[len(_.root):]}'")
-          i = findIndexOrAppend(_.tags, tag); adds.add(i)
-          appendnew(_.tag2paths[i], findex)
+          info(lambda: f"Tag <{tag}> (+<{pos}> -<{neg}>) in '{folder[len(_.root):]}'")
+          i = findIndexOrAppendIndexed(_.tags, _.tag2index, tag); adds.add(i)
+          appendnew(_.configured[i], findex)
 
     # 2. process folder's file names
-    files, folders = wrapExc(lambda: splitByPredicate(os.scandir(folder), lambda f: f.is_file(), transform = lambda f: f.name), ([], []))  # HINT right-hand side is not automatically a directory, thus filtered below:
-    folders[:] = sorted([f for f in folders if isDir(folder + SLASH + f)])  # remove special files like ".desktop"
-    if SKPFILE in files:  # HINT allow other than lower case skip file? should be no problem, as even Windows allows lower-case file names and should match here
-      info(f"Skip '{folder[len(_.root):]}' due to local skip marker file")
+    exts, folders, skp, ign, files = _.scan(folder)
+    if skp:  # HINT allow other than lower case skip file? should be no problem, as even Windows allows lower-case file names and should match here
+      info(lambda: f"Skip '{folder[len(_.root):]}' due to local skip marker file")
       return  # ignore entire sub-tree and break recursion
-    if IGNFILE in files:
-      info(f"Ignore '{folder[len(_.root):]}' due to local ignore marker file")
+    if ign:
+      info(lambda: f"Ignore '{folder[len(_.root):]}' due to local ignore marker file")
       ignore = True
-    if not ignore:
-      debug(f"Index file types for '{folder[len(_.root):]}'")
-      for _file in (ff for ff in files if DOT in ff[1:]):  # index file extensions (including this in sub-folders), without propagation to sub-folders HINT dot-first files are ignored. see below
-        ext = _file[_file.rindex(DOT):]  # split off extension, even when "empty" extension (filename ending in dot)
-        if ext not in adds:
-          i = findIndexOrAppend(_.tags, ext); adds.add(i)  # get or add file extension to local dir's tags only
-          _.tag2paths[i].append(findex)  # add current dir to index of that extension
+    if not ignore and own:
+      debug(lambda: f"Index file types for '{folder[len(_.root):]}'")
+      for ext in exts:  # index file extensions (including this in sub-folders), without propagation to sub-folders
+        i = findIndexOrAppendIndexed(_.tags, _.tag2index, ext); adds.add(i)  # get or add file extension to local dir's tags only
+        _.tag2paths[i].append(findex)  # add current dir to index of that extension
         iext = ext.lower()
         if iext != ext and not _.cfg.reduce_storage:  # store normalized extension if different from literal, unless told not to
-          i = findIndexOrAppend(_.tags, iext); adds.add(i)  # add file extension to local dir's tags only
+          i = findIndexOrAppendIndexed(_.tags, _.tag2index, iext); adds.add(i)  # add file extension to local dir's tags only
           _.tag2paths[i].append(findex)  # add current dir to index of that extension
-      # TODO #93 optionally also index file names and their tokens! this would also cover dot-first files ignored above
+      if _.cfg.index_files:  # also covers dot-first files ignored above
+        debug(lambda: f"Index file names for '{folder[len(_.root):]}'")
+        for name in set(files) | set(token for f in files for token in TOKENIZER.split(f) if token):  # file names and their tokens, without propagation to sub-folders
+          _.tag2paths[findIndexOrAppendIndexed(_.tags, _.tag2index, SLASH + name)].append(findex)  # HINT leading slash separates file names from folder names and tags, to not exclude entire folders by file names
+          iname = name.lower()
+          if iname != name and not _.cfg.reduce_storage: _.tag2paths[findIndexOrAppendIndexed(_.tags, _.tag2index, SLASH + iname)].append(findex)  # store normalized name if different from literal, unless told not to
 
     # 3.  prepare recursion
     newtags = [t for t in tags[:-last if ignore else None]]  # tags to propagate into subfolders (except current folder names if ignored)
-    cache = {}  # for faster path computation during output logging HINT cache was formerly in side folders loop
-    for subfolder in ([] if ignore else folders):  # iterate sub-folders
+    for subfolder in ([] if ignore else _.walkedFolders(folder, folders)):  # iterate sub-folders
       # 3a. add sub-folder name to "tagdirs" and "tagdir2parent"
       idxs  = []  # *first* element in "idx" is parent index to use in recursion for the currently processed subfolder
       addt  = set()  # per-subfolder local additional tokens
       added = 0
 
-      info(f"Store literal folder '{subfolder}' for '{_.getPath(findex, cache)}'")
-      idxs.append(len(_.tagdirs))  # for this subfolder, always add a *new* element, no matter if name already exists in the index, because parent differs (to keep tree structure)
-      _.tagdirs.append(subfolder)  # now add the subfolder name to the list of known tags/folders (duplicates allowed, because we build the tree structure here)
-      _.tagdir2parent.append(findex)  # add current folder index as parent of subfolder (placed at same index as tagdirs)
+      info(lambda: f"Store literal folder '{subfolder}' for '{_.getPath(findex)}'")
+      idxs.append(_.addTagdir(subfolder, findex))  # for this subfolder, always add a *new* element, no matter if name already exists in the index, because parent differs (to keep tree structure)
       added += 1
       assert len(_.tagdirs) == len(_.tagdir2parent)  # invariant
 
       iname = subfolder.lower()
       if not _.cfg.reduce_storage and iname != subfolder:
-        info(f"Store case-normalized folder '{iname}' for '{_.getPath(findex, cache)}'")
-        idxs.append(len(_.tagdirs))     # new index
-        _.tagdirs.append(iname)         # add to both
-        _.tagdir2parent.append(findex)  # data structures
+        info(lambda: f"Store case-normalized folder '{iname}' for '{_.getPath(findex)}'")
+        idxs.append(_.addTagdir(iname, findex))  # add to both data structures
+        _.aliases.append(idxs[-1])  # not a folder on disk
         added += 1
         assert len(_.tagdirs) == len(_.tagdir2parent)  # invariant
 
       tokens = [r for r in TOKENIZER.split(subfolder) if r not in ("", subfolder)]  # in addition to the folder parent mapping, split folder name into tokens
       for token in set(tokens):
-        debug(f"Store literal token '{token}' for '{_.getPath(findex, cache)}'")
-        i = findIndexOrAppend(_.tags, token); addt.add(i)
+        debug(lambda: f"Store literal token '{token}' for '{_.getPath(findex)}'")
+        i = findIndexOrAppendIndexed(_.tags, _.tag2index, token); addt.add(i)
         _.tag2paths[i].append(idxs[-added])  # link token index to stored path constituent
 
         itoken = token.lower()
         if not _.cfg.reduce_storage and itoken != token:
-          debug(f"Store case-normalized token '{itoken}' for '{_.getPath(findex, cache)}'")
-          i = findIndexOrAppend(_.tags, itoken); addt.add(i)
+          debug(lambda: f"Store case-normalized token '{itoken}' for '{_.getPath(findex)}'")
+          i = findIndexOrAppendIndexed(_.tags, _.tag2index, itoken); addt.add(i)
           _.tag2paths[i].append(idxs[-added])
 
       if not ignore:  # then index current folder
-        debug(f"Mark folder '{folder[len(_.root):]}{SLASH}{subfolder}' with " + "<%s>" % (COMB.join(set(_.tagdirs[x] for x in (newtags + idxs)) | set([_.tags[x] for x in (adds | addt)]))))  # per subfolder, not promoted to recursive call
-        for tag in newtags + idxs: _.tagdir2paths[_.tagdirs.index(_.tagdirs[tag])].extend(idxs)   # add sub-folder reference(s) for all collected parent folder tags to the tag name
+        debug(lambda: f"Mark folder '{folder[len(_.root):]}{SLASH}{subfolder}' with " + "<%s>" % (COMB.join(set(_.tagdirs[x] for x in (newtags + idxs)) | set([_.tags[x] for x in (adds | addt)]))))  # per subfolder, not promoted to recursive call
+        for tag in newtags + idxs: _.tagdir2paths[_.name2tagdir[_.tagdirs[tag]]].extend(idxs)   # add sub-folder reference(s) for all collected parent folder tags to the tag name
 
       # 4. recurse into subfolder
       try:
         if _._walk(folder = folder + SLASH + subfolder, findex = idxs[-added], tags = newtags + ([] if ignore else idxs), last = added): return True  # recursion
       except KeyboardInterrupt: return True
 
+  def dropCaches(_):
+    ''' Remove search caches that depend on the index contents, which are kept between searches when running as a server. '''
+    for name in ("allIds", "validIds", "aliasIds", "pathTable", "ruleCache", "matcherCache"): _.__dict__.pop(name, None)
+
+  def tagRules(_, folder):
+    ''' Return a folder's configured tag rules, compiled on first use for the current case matching mode and kept with the search caches.
+        returns: dictionary tag name -> list of TagRule
+    '''
+    key = (folder, normalizer.case_sensitive)
+    rules = _.__dict__.setdefault("ruleCache", {}).get(key)
+    if rules is None:
+      rules = dd()
+      for value in _.cfg.paths.get(folder, {}).get(TAG, []): rules[value[:value.index(SEPA)]].append(TagRule(value))
+      _.ruleCache[key] = rules = dict(rules)
+    return rules
+
+  def getScans(_, shards = False):
+    ''' Return folder listings of the last walk, decoding them first if loaded from a memory-mapped index.
+        shards: if True, also include the listings of all shards, loading them first
+    '''
+    if _.scans is None: _.scans = _.mapped.scans()
+    if not shards or not _.shards: return _.scans
+    scans = dict(_.scans)
+    for name in _.shards: scans.update(_.loadShard(name).getScans())
+    return scans
+
+  def addTagdir(_, name, parent = None):
+    ''' Append an entry to tagdirs, keeping the name lookup dictionaries up to date.
+        name:    folder name or tag
+        parent:  index of the parent folder entry, or None for tags that are not part of the folder tree
+        returns: index of the new entry
+    '''
+    i = len(_.tagdirs)
+    _.tagdirs.append(name)  # now add the name to the list of known tags/folders (duplicates allowed, because we build the tree structure here)
+    if parent is not None: _.tagdir2parent.append(parent)  # placed at same index as tagdirs
+    if name not in _.name2tagdir: _.name2tagdir[name] = i; _.name2tagdirs[name] = [i]
+    else: _.name2tagdirs[name].append(i)
+    return i
+
+  def indexNames(_):
+    ''' (Re-)build the name lookup dictionaries from tagdirs. '''
+    _.name2tagdir, _.name2tagdirs = {}, {}
+    for i, name in enumerate(_.tagdirs):
+      if name not in _.name2tagdir: _.name2tagdir[name] = i; _.name2tagdirs[name] = [i]
+      else: _.name2tagdirs[name].append(i)
+
+  def globalMatch(_, folder, key):
+    ''' Check if the folder's name matches any of the global folder name globs.
+        folder:  absolute folder path
+        key:     SKIPD or IGNORED
+    '''
+    return _.folderMatchers()[key].search(folder[folder.rindex(SLASH) + 1:] if folder and SLASH in folder else folder) is not None
+
+  def folderMatchers(_):
+    ''' Return the global skip and ignore folder name globs and the folders with local skip markers as one regular expression each.
+        They are compiled on first use for the current case matching mode, and kept with the search caches.
+        The global ones match a folder name, or any (skip) or the last (ignore) constituent of a root-relative path, the local one a skipped folder or any of its sub-folders.
+        returns: dictionary SKIPD, IGNORED, SKIP -> compiled regular expression
+    '''
+    cache = _.__dict__.get("matcherCache")
+    if cache is None or cache[0] != normalizer.case_sensitive:
+      flags = 0 if normalizer.case_sensitive else re.IGNORECASE
+      def names(key, end):
+        globs = [globToRegex(glob) for glob in _.cfg.paths.get('', {}).get(key, []) if glob]
+        return re.compile("(?:^|/)(?:" + "|".join(globs) + ")" + end if globs else "(?!)", flags)  # never matches if nothing configured
+      skipped = [re.escape(path) for path, marks in _.cfg.paths.items() if SKIP in marks]
+      _.matcherCache = cache = (normalizer.case_sensitive, {
+        SKIPD:   names(SKIPD, r"(?:/|\Z)"),
+        IGNORED: names(IGNORED, r"\Z"),
+        SKIP:    re.compile("(?:" + "|".join(skipped) + r")(?:/|\Z)" if skipped else "(?!)")})
+    return cache[1]
+
+  def validFolders(_):
+    ''' Return the ids of all indexed folders except skipped and ignored ones, computed on first use for the current case matching mode and kept with the search caches.
+        returns: bitset over folder ids
+    '''
+    cache = _.__dict__.get("validIds")
+    if cache is None or cache[0] != normalizer.case_sensitive:  # matching the globs depends on the case mode
+      idirs, matchers = dictGet(dictGet(_.cfg.paths, '', {}), IGNORED, []), _.folderMatchers()
+      ignored, skipped, marked = matchers[IGNORED].search, matchers[SKIPD].search, matchers[SKIP].match
+      valid = lambda path: not (ignored(path) if path else '' in idirs) and not (path and skipped(path)) and not marked(path) and IGNORE not in dictGet(_.cfg.paths, path, {})  # TODO shouldn't this already be covered by the index? but tests fail if removed
+      _.validIds = cache = (normalizer.case_sensitive, idsToBits(i for i in bitsToIds(_.allIds) if valid(_.getPath(i))))
+      debug(f"Prune skipped and ignored paths from {bitCount(_.allIds)} to {bitCount(cache[1])} paths")
+    return cache[1]
+
+  def prefetch(_, jobs):
+    ''' Scan all folders the walk will visit on a pool of worker threads, to overlap the waiting for (network) file systems.
+        The walk then assembles the index from these listings in its usual deterministic order.
+        jobs:    number of worker threads
+        returns: dict of absolute folder path -> 2-tuple(listing, scanned?) as returned by _.listing()
+    '''
+    info(f"Scan folder tree using {jobs} threads")
+    listings, pending = {}, set()
+    with ThreadPoolExecutor(max_workers = jobs) as pool:
+      def submit(folder):  # apply the same configured skip semantics as the walk, to avoid scanning skipped folder trees
+        if SKIP in _.cfg.paths.get(folder[len(_.root):], {}) or _.globalMatch(folder, SKIPD): return
+        pending.add(pool.submit(lambda: (folder, _.listing(folder))))
+      submit(_.root)
+      while pending:
+        done, pending = wait(pending, return_when = FIRST_COMPLETED)
+        for future in done:
+          folder, listing = future.result()
+          listings[folder] = listing
+          stamp, exts, folders, skp, ign, files = listing[0]
+          if skp or ign or IGNORE in _.cfg.paths.get(folder[len(_.root):], {}) or _.globalMatch(folder, IGNORED): continue  # walk doesn't recurse into these
+          for subfolder in _.walkedFolders(folder, folders): submit(folder + SLASH + subfolder)
+    return listings
+
+  def walkedFolders(_, folder, folders):
+    ''' Restrict the root folder's sub-folders to those covered by this index, if sharded.
+        folder:  absolute folder path
+        folders: names of the folder's sub-folders
+        returns: names of the sub-folders to walk
+    '''
+    if folder != _.root: return folders
+    if _.shard is not None: return [f for f in folders if f == _.shard]
+    return [f for f in folders if f not in _.shards] if _.shards else folders
+
+  def shardFolders(_):
+    ''' Determine the top-level folders to index in their own shards, according to the configured shard globs.
+        returns: sorted list of folder names
+    '''
+    globs = _.cfg.paths.get("", {}).get(SHARD, [])  # without adding the key to the default dictionary
+    if not globs: return []
+    metrics.count("scandir_calls")
+    folders = wrapExc(lambda: [f.name for f in os.scandir(_.root) if f.is_dir()], [])
+    return sorted(f for f in folders if xany(lambda glob: normalizer.globmatch(f, glob), globs) and SKIP not in _.cfg.paths.get(SLASH + f, {}) and not _.globalMatch(_.root + SLASH + f, SKIPD))  # skipped folders would result in empty shards
+
+  def shardFile(_, name):
+    ''' Absolute path of the shard file for a top-level folder. '''
+    return os.path.join(_.meta, SHDFILE % zlib.crc32(name.encode("utf-8")))
+
+  def loadShard(_, name):
+    ''' Return the shard for a top-level folder, loading it from its file on first access. May run on a worker thread. '''
+    shard = _.shardIndexes.get(name)
+    if shard is None:
+      metrics.count("shards_loaded")
+      shard = Indexer(_.root)
+      shard.read(_.shardFile(name))  # always stored along with this index. doesn't touch the case matching mode, which is global state shared with other threads and set up by this index's load()
+      shard.cfg, shard.shard = _.cfg, name  # same configuration as this index. memory-mapped shards don't store their name
+      _.shardIndexes[name] = shard
+    return shard
+
+  def walkShards(_, names, incremental = False, jobs = 1, changed = None):
+    ''' (Re-)build the shards of the given top-level folders, independently of each other and of this index, on up to jobs worker threads.
+        names:       top-level folder names
+        incremental: if True, re-use the folder listings of the shards' previous walks, cf. walk()
+        changed:     root-relative folders known to be modified, cf. walk()
+        returns:     number of re-scanned folders
+    '''
+    def walkShard(name):
+      shard = _.loadShard(name) if incremental and _.meta and os.path.exists(_.shardFile(name)) else None
+      if shard is None: shard = Indexer(_.root); shard.shard = name
+      info(f"Walk shard '{name}'")
+      rescanned = shard.walk(_.cfg, incremental = incremental, changed = None if changed is None else set(c for c in changed if c.split(SLASH)[1:2] in ([], [name])), jobs = 1)
+      _.shardIndexes[name] = shard
+      if _.shards is None: _.shards = {}
+      _.shards[name] = frozenset(shard.name2tagdir)  # manifest entry: shards that don't contain a tag are never loaded for it
+      _.pending.add(name)
+      return rescanned
+    with ThreadPoolExecutor(max_workers = max(1, jobs)) as pool: return sum(pool.map(walkShard, names))
+
+  def shardMayMatch(_, name, include):
+    ''' Check via the manifest, whether a shard may contain folders with all inclusive tags, without loading it. Uses the same names as planQuery(). '''
+    names = _.shards[name]
+    for tag in include:
+      if isGlob(tag):
+        if not normalizer.globfilter([n[1:] if n[:1] == SLASH else n for n in names], tag): return False
+      elif not xany(lambda key: key in names, [tag, SLASH + tag] + ([normalizer.filenorm(tag[tag.index(DOT):])] if DOT in tag else [])): return False
+    return True
+
+  def scan(_, folder):
+    ''' List the folder contents relevant for indexing, re-using the previous walk's listing if the folder's modification stamp didn't change.
+        folder:  absolute folder path
+        returns: 5-tuple(sorted file extensions, sorted sub-folder names, skip marker?, ignore marker?, sorted file names or None)
+    '''
+    entry, scanned = _.prefetched.pop(folder, None) or _.listing(folder)
+    _.scans[folder[len(_.root):]] = entry
+    if scanned: _.rescanned += 1
+    return entry[1:]
+
+  def listing(_, folder):
+    ''' Determine the folder listing, unless the previous walk's listing is still current. May run on a worker thread.
+        folder:  absolute folder path
+        returns: 2-tuple(6-tuple(modification stamp or None, sorted file extensions, sorted sub-folder names, skip marker?, ignore marker?, sorted file names or None), scanned?)
+    '''
+    rel = folder[len(_.root):]
+    old = _.oldscans.get(rel)
+    if old is not None and old[0] is not None and len(old) == 6 and (old[5] is not None or not _.cfg.index_files) and \
+      (rel not in _.changed if _.changed is not None else old[0] == wrapExc(lambda: folderStamp(folder, old[3], old[4]))): return old, False  # file names only stored if indexed
+    debug(lambda: f"Scan '{rel}'")
+    metrics.count("folders_scanned"); metrics.count("scandir_calls"); metrics.count("stat_calls")
+    before = wrapExc(lambda: os.stat(folder).st_mtime_ns)  # taken before listing, to detect modifications during listing
+    files, folders = wrapExc(lambda: splitByPredicate(os.scandir(folder), lambda f: f.is_file(), transform = lambda f: f.name), ([], []))  # HINT right-hand side is not automatically a directory, thus filtered below:
+    folders[:] = sorted([f for f in folders if isDir(folder + SLASH + f)])  # remove special files like ".desktop"
+    exts = sorted(set(f[f.rindex(DOT):] for f in files if DOT in f[1:]))  # split off extension, even when "empty" extension (filename ending in dot) HINT dot-first files are ignored
+    skp, ign = SKPFILE in files, IGNFILE in files
+    stamp = wrapExc(lambda: folderStamp(folder, skp, ign))
+    if stamp is None or stamp[0] != before or stamp[0] >= _.started - MTIME_SLACK: stamp = None  # cannot trust the listing, always re-scan next time
+    names = sorted(f for f in files if f not in (CONFIG, INDEX, SKPFILE, IGNFILE) and not SHDFILES.fullmatch(f)) if _.cfg.index_files else None  # only kept if indexed, as they may be numerous
+    return (stamp, exts, folders, skp, ign, names), True
+
   def mapTagsIntoDirsAndCompressIndex(_):
     ''' After folder tree recursion, map file extensions and manually set tags into the tagdir structure to save space. '''
     info("Map tags into folder index")
     for itag, tag in enumerate(_.tags):  # combine manual tags with automatic folder name entries
-      idx = findIndexOrAppend(_.tagdirs, tag)  # get (first matching) index in list or create one
+      idx = _.name2tagdir.get(tag)  # get (first matching) index in list or create one
+      if idx is None: idx = _.addTagdir(tag)
       _.tagdir2paths[idx].extend(_.tag2paths[itag])  # tag2paths contains true parent folder index from _.tagdirs array
+    _.tagged = {}
+    for itag, ids in _.configured.items():  # configured tags last, to know which folders are only tagged by the configuration
+      idx = _.name2tagdir[_.tags[itag]]
+      _.tagged[_.tags[itag]] = sorted(set(ids) - set(_.tagdir2paths[idx]))
+      _.tagdir2paths[idx].extend(ids)
 
     rm = [tag for tag, dirs in _.tagdir2paths.items() if len(dirs) == 0]  # find entries that are empty due to ignores
-    for r in rm: del _.tagdir2paths[r]; debug(f"Remove childless tag '{_.tagdirs[r]}'")  # remove empty lists from index (was too optimistic, removed by ignore or skip)
+    for r in rm: del _.tagdir2paths[r]; debug(lambda: f"Remove childless tag '{_.tagdirs[r]}'")  # remove empty lists from index (was too optimistic, removed by ignore or skip)
     debug(f"Removed {len(rm)} childless tags from index")
 
     found = 0
@@ -363,56 +767,158 @@ class Indexer(object):
       _.tagdir2paths[tag] = dirs  # remove duplicates HINT converts to set
       found += (l - len(_.tagdir2paths[tag]))
     if found: debug(f"Removed {found} duplicates from index")
-    del _.tags, _.tag2paths  # remove temporary structures
+    del _.tags, _.tag2index, _.tag2paths, _.configured  # remove temporary structures
     info(f"Indexed {len(_.tagdirs)} folders with {len(_.tagdir2paths)} tags")  # log must be before next line because structure is expanded to list below
     _.tagdir2paths = [_.tagdir2paths[i] if i in _.tagdir2paths else set() for i in range(max(_.tagdir2paths) + 1)] if _.tagdir2paths else []  # safely convert map values to list positions (as we don't know if all exist)
+    _.indexTrigrams()
+    if _.cfg.compact_index: _.compact()
+
+  def configuredTags(_, cfg):
+    ''' Determine the indexed folders that configured tags and folder mappings apply to, with the same semantics as _walk().
+        cfg:     configuration to evaluate
+        returns: dict of tag name -> set of folder indices, or None if a configured folder is missing in the index although the walk would index it (e.g. created after the last walk)
+    '''
+    tagged = {}
+    for path, marks in cfg.paths.items():
+      if TAG not in marks and FROM not in marks: continue
+      findex = _.findPath(path)
+      folder = _.root + path
+      if findex is None and not _.notWalked(path): debug(f"Configured folder '{path}' not yet indexed"); return None
+      if findex is None or SKIP in marks or _.globalMatch(folder, SKIPD): continue  # not indexed, e.g. inside a skipped folder tree
+      tags = marks.get(TAG, []) if IGNORE not in marks and not _.globalMatch(folder, IGNORED) else []
+      for f in marks.get(FROM, []):
+        other = os.path.normpath(os.path.join(folder, pathNorm(f)))[len(_.root):] if not f.startswith(SLASH) else pathNorm(f)
+        tags = tags + cfg.paths.get(other, {}).get(TAG, [])
+      for t in tags: dictGetSet(tagged, t.split(SEPA)[0], set()).add(findex)
+    return tagged
+
+  def notWalked(_, path):
+    ''' Check if the walk doesn't index a folder by configuration or marker files, because it is skipped itself or below a skipped or ignored folder.
+        path:    root-relative folder path
+    '''
+    matchers, scans = _.folderMatchers(), _.getScans()
+    if matchers[SKIPD].search(path) or matchers[SKIP].match(path): return True
+    while path:
+      path = path[:path.rindex(SLASH)]  # parent folder
+      entry = scans.get(path)
+      if IGNORE in _.cfg.paths.get(path, {}) or (path and matchers[IGNORED].search(path)) or (entry is not None and (entry[3] or entry[4])): return True  # not recursed into, cf. prefetch()
+    return False
+
+  def applyConfiguration(_, cfg):
+    ''' Update the index for a modified configuration without walking the folder tree, if only configured tags or folder mappings changed.
+        Only the posting lists of the affected tags are modified, removing just those folders that were contributed by the configuration.
+        cfg:     modified configuration
+        returns: True if applied, False if the index must be re-assembled by walking (e.g. for modified settings, skips or ignores)
+    '''
+    if _.mapped or _.tagged is None or _.shards: return False  # memory-mapped indexes are read-only, configured tags may apply to folders in shards
+    settings = lambda c: {k: v for k, v in c.__dict__.items() if k != "paths"}
+    others = lambda c: {path: o for path, o in ((path, {k: v for k, v in marks.items() if k not in (TAG, FROM)}) for path, marks in c.paths.items()) if o}
+    if settings(cfg) != settings(_.cfg) or others(cfg) != others(_.cfg): return False
+    old, new = _.configuredTags(_.cfg), _.configuredTags(cfg)
+    if old is None or new is None: return False  # the walk adds the missing folders
+    compact = isinstance(_.tagdirs, StringTable)
+    if compact and any(tag not in _.name2tagdir for tag in new): return False  # cannot add names to the string table
+    postings = [set(ids) for ids in _.tagdir2paths] if compact else _.tagdir2paths
+    added = 0
+    for tag in set(old) | set(new):
+      add, remove = new.get(tag, set()) - old.get(tag, set()), old.get(tag, set()) - new.get(tag, set())
+      if not add and not remove: continue
+      debug(lambda: f"Configured tag <{tag}>: add {len(add)}, remove {len(remove)} folders")
+      idx = _.name2tagdir.get(tag)
+      if idx is None: idx = _.addTagdir(tag); added += 1
+      while len(postings) <= idx: postings.append(set())
+      only = set(_.tagged.get(tag, ()))
+      postings[idx] -= remove & only  # other folders have the tag also from their names or contents
+      only = (only - remove) | (add - postings[idx])
+      postings[idx] |= add
+      _.tagged[tag] = sorted(only)
+    if compact: _.tagdir2paths = Postings(postings)
+    if added: _.indexTrigrams()
+    _.cfg = cfg
+    _.dropCaches()
+    info("Applied configuration changes to index")
+    return True
+
+  def indexTrigrams(_):
+    ''' Build the trigram index over all distinct names, which grows linearly with the total length of the names. '''
+    trigrams = dd()
+    for name, i in sorted(_.name2tagdir.items(), key = lambda item: item[1]):  # ascending indices result in sorted posting lists
+      for trigram in nameTrigrams(name[1:] if name[:1] == SLASH else name): trigrams[trigram].append(i)  # file names are globbed without their prefix
+    _.trigrams = {trigram: array('I', ids) for trigram, ids in trigrams.items()}
+    debug(f"Indexed {len(_.trigrams)} trigrams of {len(_.name2tagdir)} names")
+
+  def compact(_):
+    ''' Convert the index into its compact read-only representation, which avoids one Python object per entry.
+        tagdirs becomes a string table, tagdir2parent an integer array, and tagdir2paths one flat array of sorted posting lists with an offsets array.
+    '''
+    debug("Compact index")
+    _.tagdirs       = StringTable(_.tagdirs)
+    _.tagdir2parent = array('I', _.tagdir2parent)
+    _.tagdir2paths  = Postings(_.tagdir2paths)
+    _.aliases       = array('I', _.aliases)
 
 
-  def getPath(_, idx, cache):
-    ''' Return one root-relative path for the given index by recursively going through {index: name} mappings and combining them into a full path.
+  def getPath(_, idx):
+    ''' Return the root-relative path for the given folder entry index from the path table, extending the table first if the index isn't covered yet.
         idx:     folder entry index from _.tagdirs
-        cache:   dictionary for speeding up consecutive calls (remembers already collected parent path mappings)
         returns: root-relative path string
-    >>> i = Indexer("bla"); c = {}
+    >>> i = Indexer("bla")
     >>> i.tagdirs = ["", "a", "b", "c"]
     >>> i.tagdir2parent = [0,  0,   1,   1]  # same positions as in tagdirs
-    >>> print(repr(i.getPath(0, c)))
+    >>> print(repr(i.getPath(0)))
     ''
-    >>> print(c)
-    {}
-    >>> print(i.getPath(1, c))
-    /a
-    >>> print(c)
-    {1: '/a'}
-    >>> print(i.getPath(3, c))
-    /a/c
-    >>> print(sorted(c.items()))
-    [(1, '/a'), (3, '/a/c')]
-    '''
-    if idx == 0: return ""  # root
-    assert 0 <= idx < len(_.tagdirs)
-    found = cache.get(idx, None)
-    if found is not None: return found
-    parent_idx = _.tagdir2parent[idx]  # get parent index from tree-structure
-    parent = dictGetSet(cache, parent_idx, _.getPath(parent_idx, cache)) if parent_idx != 0 else ""  # recursive folder name resolution
-    cache[idx] = new_ = parent + SLASH + _.tagdirs[idx]
-    return new_
-
-  def getPaths(_, ids, cache):
+    >>> print((i.getPath(1), i.getPath(3)))
+    ('/a', '/a/c')
+    >>> i.tagdirs.append("d"); i.tagdir2parent.append(3)  # during walk
+    >>> print(i.getPath(4))
+    /a/c/d
+    '''
+    assert 0 <= idx < len(_.tagdir2parent)
+    if idx >= len(_.__dict__.get("pathTable", ())): _.extendPathTable()
+    return _.pathTable[idx]
+
+  def extendPathTable(_):
+    ''' Compute the root-relative paths of all folder entries not yet in the path table, without recursion.
+        Parents always precede their children in tagdirs, so that each path is its parent's path plus the folder name.
+        The table is computed lazily on first use, not stored in the index, and dropped with the other search caches.
+    '''
+    if "pathTable" not in _.__dict__: _.pathTable = [""]  # root
+    table, tagdirs, parents = _.pathTable, _.tagdirs, _.tagdir2parent
+    for i in range(len(table), len(parents)): table.append(table[parents[i]] + SLASH + tagdirs[i])
+
+  def getPaths(_, ids):
     ''' Returns a generator for respective paths of the given path index list.
         ids:     iterable of tagdirs ids
-        cache:   dictionary for speeding up consecutive calls to _.getPath()
         returns: generator that yields root-relative path strings
     >>> i = Indexer("blupp")
     >>> i.tagdirs =       ["", "a", "b", "c"]
     >>> i.tagdir2parent = [0,  0,   1,   1]  # same positions as in tagdirs
-    >>> c = {}; g = i.getPaths(range(4), c)
+    >>> g = i.getPaths(range(4))
     >>> print(" ".join([next(g), next(g), next(g), next(g)]))  # indented because of empty root path
      /a /a/b /a/c
-    >>> print(len(c))  # cache size
-    3
+    >>> print(len(i.pathTable))
+    4
+    '''
+    if len(_.tagdir2parent) > len(_.__dict__.get("pathTable", ())): _.extendPathTable()
+    table = _.pathTable
+    return (table[i] for i in ids)
+
+  def findPath(_, path):
+    ''' Find the folder entry for a root-relative path by following the folder names from the root.
+        path:    root-relative path
+        returns: index in tagdirs, or None if not indexed
+    >>> i = Indexer("bla")
+    >>> i.tagdirs = ["", "a", "b", "b", "tag"]
+    >>> i.tagdir2parent = [0, 0,   1,   0]  # tags have no parent entry
+    >>> i.indexNames()
+    >>> print((i.findPath(""), i.findPath("/a/b"), i.findPath("/b"), i.findPath("/b/a"), i.findPath("/tag")))
+    (0, 2, 3, None, None)
     '''
-    return (_.getPath(i, cache) for i in ids)
+    idx = 0
+    for name in path.split(SLASH)[1:]:
+      idx = next((i for i in _.name2tagdirs.get(name, ()) if i < len(_.tagdir2parent) and i != 0 and _.tagdir2parent[i] == idx), None)
+      if idx is None: return None
+    return idx
 
   def removeIncluded(_, includedTags, excludedPaths):
     ''' Return those paths, that have no manual tags or FROM tags from the inclusion list; subtract from the exclusion list to reduce set of paths to ignore.
@@ -435,54 +941,199 @@ class Indexer(object):
       if retainit: retain.append(path)
     return set(retain)
 
-  def findFolders(_, include, exclude, returnAll = False, checkPaths = True):
+  def postings(_, name):
+    ''' Return the folder indices indexed for a name (folder name, tag, extension), or an empty tuple. '''
+    idx = _.name2tagdir.get(name)
+    return _.tagdir2paths[idx] if idx is not None and idx < len(_.tagdir2paths) else ()
+
+  def postingSize(_, name):
+    ''' Number of folders indexed for a name, without copying its posting list. '''
+    idx = _.name2tagdir.get(name)
+    if idx is None or idx >= len(_.tagdir2paths): return 0
+    return _.tagdir2paths.size(idx) if isinstance(_.tagdir2paths, Postings) else len(_.tagdir2paths[idx])
+
+  def planQuery(_, include, exclude):
+    ''' Determine the order of filtering steps for findFolders().
+        Inclusive tags are intersected from the smallest number of folders up, so that the candidate set shrinks fast and an empty intersection stops early.
+        Globs are expanded last, as matching them against all indexed names is costly and unnecessary once nothing remains.
+        Exclusive tags follow in the given order, checking configured tags (removeIncluded) only for the remaining candidates.
+        returns: list of 5-tuple(operation, tag, kind, estimated number of folders or None if unknown, index names to combine or None for globs)
+    >>> i = Indexer("bla"); i.cfg = Configuration()
+    >>> i.tagdirs = ["", "a", "b", ".x"]; i.tagdir2paths = [set(), {1, 2}, {2}, {1, 2, 3}]; i.indexNames()
+    >>> for step in i.planQuery(["a", "*", "c.x", "b"], ["a"]): print(step)
+    ('include', 'b', 'tag', 1, ['b'])
+    ('include', 'a', 'tag', 2, ['a'])
+    ('include', 'c.x', 'extension', 3, ['.x'])
+    ('include', '*', 'glob', None, None)
+    ('exclude', 'a', 'tag', 2, ['a'])
+    '''
+    steps = []
+    for tag in include:
+      if isGlob(tag): steps.append(("include", tag, "glob", None, None))
+      elif DOT in tag:
+        key = SLASH + tag if _.cfg.index_files and SLASH + tag in _.name2tagdir else normalizer.filenorm(tag[tag.index(DOT):])  # the file name, if indexed, otherwise its extension
+        steps.append(("include", tag, "file name" if key[0] == SLASH else "extension", _.postingSize(key), [key]))
+      else:  # no glob, no extension: tag or file name, or a DOT-leading file/folder name
+        keys = [tag] + ([SLASH + tag] if _.cfg.index_files else [])  # also folders containing files with that name or name token
+        steps.append(("include", tag, "tag", sum(_.postingSize(key) for key in keys), keys))
+    steps.sort(key = lambda step: (step[3] is None, step[3] or 0))  # stable: globs last in given order
+    return steps + [("exclude", tag, "tag", _.postingSize(tag), [tag]) for tag in exclude]
+
+  def globCandidates(_, glob):
+    ''' Pre-select the indexed names that may match a glob, by intersecting the names containing each of its literal trigrams.
+        Returns all names for globs without literal trigrams (like "*" or "?a?"), or for indexes created without trigrams.
+        The returned names still need to be matched against the glob.
+    >>> i = Indexer("bla"); i.cfg = Configuration()
+    >>> i.tagdirs = ["", "project", "Projekt", "proj", ".xml"]; i.indexNames(); i.indexTrigrams()
+    >>> print((i.globCandidates("*proj*"), i.globCandidates("*oje?t"), i.globCandidates(".x*"), i.globCandidates("*jpg*"), len(i.globCandidates("*.x*"))))
+    (['project', 'Projekt', 'proj'], ['project', 'Projekt'], ['.xml'], [], 5)
+    '''
+    required = globTrigrams(glob)
+    if not required or _.trigrams is None: return list(_.name2tagdir)
+    postings = sorted((_.trigrams.get(trigram, ()) for trigram in required), key = len)  # intersect starting with the rarest trigram
+    ids = set(postings[0])
+    for posting in postings[1:]:
+      if not ids: break
+      ids.intersection_update(posting)
+    return [_.tagdirs[i] for i in sorted(ids)]
+
+  def findFolders(_, include, exclude, returnAll = False, checkPaths = True, explain = False):
     ''' Find intersection of all indexed folders with specified tags, from over-generic index.
+        For a sharded index, only the shards whose manifest entry contains all inclusive tags are loaded and searched.
         include:   list of tag names that must be present
         exclude:   list of tag names that must not be present
         returnAll: shortcut flag that simply returns *all paths* from the index instead of finding and filtering results (from tp.find())
+        explain:   if True, show the query plan with estimated and actual numbers of folders per step
         returns:   list of folder paths (case-normalized or both normalized and as is, depending on the case-sensitive option)
     '''
+    if not _.shards: return _._findFolders(include, exclude, returnAll, checkPaths, explain)
+    results = [_._findFolders(include, exclude, returnAll, checkPaths, explain)]  # root folder and top-level folders without shard
+    for name in sorted(_.shards):
+      if not returnAll and not _.shardMayMatch(name, include): debug(f"Skip shard '{name}'"); continue
+      if explain: warn(f"Shard '{name}':")
+      results.append(_.loadShard(name)._findFolders(include, exclude, returnAll, checkPaths, explain))
+    return list(heapq.merge(*results, key = lambda path: path[1:].split(SLASH)[0]))  # interleave by top-level folder name like the walk order, keeping each index's order
+
+  def _findFolders(_, include, exclude, returnAll = False, checkPaths = True, explain = False):
+    ''' Find folders in this index only, ignoring any shards, cf. findFolders(). '''
     idirs, sdirs = dictGet(dictGet(_.cfg.paths, '', {}), IGNORED, []), dictGet(dictGet(_.cfg.paths, '', {}), SKIPD, [])  # get lists of ignored and skipped paths
-    cache = {}
-    def rebuild():
+    if not hasattr(_, "allIds"):  # lazy computation of union of all paths (cached when running as a server)
       debug(f"Build list of all paths.  Global ignores: {idirs}  Global skips: {sdirs}")
-      return set(_.getPaths(list(reduce(lambda a, b: a.update(set(b)) or a, _.tagdir2paths, set())), cache))  # compute union of all paths (cached when running as a server)
-    _.allPaths = wrapExc(lambda: _.allPaths, rebuild)  # lazy computation. fails and computes if property not defined
-    alls = [path for path in _.allPaths if not pathHasGlobalIgnore(path, idirs) and not pathHasGlobalSkip(path, sdirs) and not anyParentIsSkipped(path, _.cfg.paths) and IGNORE not in dictGet(_.cfg.paths, path, {})]  # TODO shouldn't this already be covered by the index? but tests fail if removed
-    if returnAll or len(include) == 0:  # if only exclusive tags, we need all paths and prune them later
-      debug(f"Prune skipped and ignored paths from {len(_.allPaths)} to {len(alls)} paths")
-      if returnAll:
-        alls = [a for a in alls if not checkPaths or os.path.isdir(_.root + os.sep + a)]  # ensure that only correct letter cases are retained on case-sensitive file systems
-        return alls
-    paths, first = (set() if len(include) else alls), True  # first filtering action (inclusive or exclusive)
-    for tag in include:  # positive restrictive matching
-      debug(f"Filter {len(alls if first else paths)} paths by inclusive tag <{tag}>")
-      if isGlob(tag):  # filters indexed extensions by extension's glob (".c??"")
-        new = reduce(lambda a, b: a.update(set(_.getPaths(_.tagdir2paths[_.tagdirs.index(b)], cache))) or a, normalizer.globfilter(_.tagdirs, tag), set())  # in-place version
-      elif DOT in tag:
-        new = wrapExc(lambda: set(_.getPaths(_.tagdir2paths[_.tagdirs.index(normalizer.filenorm(tag[tag.index(DOT):]))], cache)), set())  # directly from index
-      else:  # no glob, no extension: tag or file name
-        new = wrapExc(lambda: set(_.getPaths(_.tagdir2paths[_.tagdirs.index(tag)], cache)), set())  # directly from index, or a DOT-leading file/folder name
-      if first: paths = new; first = False
-      else: paths.intersection_update(new)
-    for tag in exclude:  # we don't excluded globs here, because we would also exclude potential candidates (because index is over-specified)
-      debug(f"Filter {len(paths)} paths by exclusive tag <{tag}>")
-      potentialRemove = wrapExc(lambda: set(_.getPaths(_.tagdir2paths[_.tagdirs.index(tag)], cache)), set())  # these paths can only be removed, if no manual tag/file extension/glob in config or FROM
-      new = _.removeIncluded(include, potentialRemove)  # remove paths with includes from "remove" list (adding back)
-      if first:  # start with all paths, except determined excluded paths
-        paths = _.allPaths - new
-        first = False
-      else:
-        paths.difference_update(new)  # reduce found paths by exclude matches
-    # Now convert to return list, which may differ from previously computed set of paths
-    paths = list(paths)
+      _.allIds = idsToBits(i for ids in _.tagdir2paths for i in ids)
+    validIds = _.validFolders() if returnAll or len(include) == 0 else None  # all paths except skipped and ignored ones, if only exclusive tags, we need all paths and prune them later
+    verify = _.cfg.verify_case or _.aliases is None  # indexes created by older versions don't know which entries are case-normalized copies
+    if checkPaths and not verify and not hasattr(_, "aliasIds"): _.aliasIds = idsToBits(_.aliases)
+    if returnAll:
+      if not checkPaths: return list(_.getPaths(bitsToIds(validIds)))
+      if not verify: return list(_.getPaths(bitsToIds(validIds & ~_.aliasIds)))  # trust the index to know the letter case on disk
+      return _.existingFolders(_.getPaths(bitsToIds(validIds)))  # ensure that only correct letter cases are retained on case-sensitive file systems
+    ids = _.executePlan(_.planQuery(include, exclude), include, 0 if len(include) else validIds, explain)
+    if _.cfg.case_sensitive and checkPaths: ids &= ~((0 if verify else _.aliasIds) | 1)  # eliminate case-normalized copies of folder names without checking the file system. the root folder (id 0) was never retained by the letter case check
+    paths = list(_.getPaths(bitsToIds(ids)))  # only the surviving ids are converted to paths
     debug(f"Found {len(paths)} path matches")
-    if _.cfg.case_sensitive:  # eliminate different letter cases, otherwise return both, although only one physically exists TOOD why not use "not"?
-      paths[:] = [p for p in paths if not checkPaths or os.path.basename(p) in [f.name for f in os.scandir(_.root + (os.sep + os.path.dirname(p) if SLASH in p else '')) if f.is_dir()]]  # ensure that only correct letter cases are retained on case-sensitive file systems
-      debug(f"Retained {len(paths)} paths after removing duplicates")  # TODO on windows, all checks may succeed although case differs!
+    if _.cfg.case_sensitive and checkPaths and verify:  # eliminate different letter cases, otherwise return both, although only one physically exists TOOD why not use "not"?
+      paths = _.existingFolders(paths)  # ensure that only correct letter cases are retained on case-sensitive file systems
+      debug(f"Retained {len(paths)} paths after removing duplicates")
     assert all(path.startswith(SLASH) or path == '' for path in paths), paths  # only return root-relative paths
     return paths
 
+  def executePlan(_, plan, include, ids, explain = False):
+    ''' Filter the indexed folders by the steps of a query plan, cf. planQuery().
+        include: all inclusive tags, to keep folders that configured tags or mappings add back
+        ids:     bitset of folders to return if the plan is empty
+        explain: if True, show the estimated and actual numbers of folders per step
+        returns: bitset over folder ids
+    '''
+    if explain: warn("Query plan:")
+    first, configured = True, None  # first filtering action (inclusive or exclusive)
+    for number, (operation, tag, kind, estimate, keys) in enumerate(plan, start = 1):
+      if not first and not ids:  # nothing left to filter
+        if explain: warn(f"  {number}. {operation} <{tag}> ({kind}): estimated {'?' if estimate is None else estimate}, skipped")
+        continue
+      candidates = _.allIds if first else ids
+      if operation == "include":  # positive restrictive matching
+        debug(f"Filter {bitCount(candidates)} paths by inclusive tag <{tag}>")
+        ids = candidates & _.termIds(tag, kind, keys)
+      else:  # we don't excluded globs here, because we would also exclude potential candidates (because index is over-specified)
+        debug(f"Filter {bitCount(ids)} paths by exclusive tag <{tag}>")
+        if configured is None: configured = idsToBits(i for i in (_.findPath(path) for path in _.cfg.paths) if i is not None)  # folders with configuration entries
+        ids = candidates & ~_.excludedIds(include, keys, candidates & configured)  # start with all paths, or reduce found paths by exclude matches
+      first = False
+      if explain: warn(f"  {number}. {operation} <{tag}> ({kind}): estimated {'?' if estimate is None else estimate}, actual {bitCount(ids)}")
+    return ids
+
+  def termIds(_, tag, kind, keys):
+    ''' Return the folders that contain any of the index names of an inclusive query plan step, expanding globs first.
+        returns: bitset over folder ids
+    '''
+    if kind == "glob":  # filters indexed extensions by extension's glob (".c??""). expanded last, when the candidate set is already small
+      names = _.globCandidates(tag)  # only names sharing the glob's literal trigrams need to be matched
+      keys = normalizer.globfilter([name for name in names if name[:1] != SLASH], tag)  # folder names, tags and extensions
+      if _.cfg.index_files: keys += [SLASH + name for name in normalizer.globfilter([name[1:] for name in names if name[:1] == SLASH], tag)]  # file names and their tokens
+    return idsToBits(i for key in keys for i in _.postings(key))  # union of all matches as bitset over folder ids, directly from index
+
+  def excludedIds(_, include, keys, configured):
+    ''' Return the folders to remove for the index names of an exclusive query plan step.
+        include:    all inclusive tags
+        configured: bitset of remaining candidate folders with configuration entries, which are kept if configured tags or mappings add back any inclusive tag
+        returns:    bitset over folder ids
+    '''
+    remove = idsToBits(i for key in keys for i in _.postings(key))  # these paths can only be removed, if no manual tag/file extension/glob in config or FROM
+    check = remove & configured  # only check remaining candidates
+    if check:
+      potentialRemove = {_.getPath(i): i for i in bitsToIds(check)}
+      retain = _.removeIncluded(include, set(potentialRemove))  # remove paths with includes from "remove" list (adding back)
+      remove &= ~idsToBits(i for path, i in potentialRemove.items() if path not in retain)
+    return remove
+
+  def existingFolders(_, paths):
+    ''' Retain only those folders that exist on disk in exactly the given letter case, listing each parent folder only once.
+        paths:   root-relative folder paths
+        returns: list of existing paths in the given order
+    '''
+    listings = {}  # parent folder -> names of its sub-folders
+    def exists(path):
+      if path == '': return True  # root
+      parent = path[:path.rindex(SLASH)]
+      if parent not in listings:
+        metrics.count("scandir_calls")
+        listings[parent] = set(wrapExc(lambda: [f.name for f in os.scandir(_.root + parent) if f.is_dir()], []))
+      return path[len(parent) + 1:] in listings[parent]
+    return [path for path in paths if exists(path)]
+
+  def search(_, poss, negs, onlyfolders = False, explain = False, jobs = 1, limit = None):
+    ''' Find all folders and their files that match the given tags.
+        poss:        list of (opt. case-normalized) inclusive tags, file extensions, file names or globs
+        negs:        list of (opt. case-normalized) exclusive tags, file extensions, file names or globs
+        onlyfolders: only find folders that contain matches, without filtering their files
+        explain:     show the query plan, cf. findFolders()
+        jobs:        if larger than 1, filter the files of that many folders concurrently on worker threads, still yielding results in folder order
+        limit:       if set, stop after yielding that many files (or folders if onlyfolders), without filtering the files of further folders
+        returns:     generator of 2-tuple(root-relative folder path, set of matching file names or None if onlyfolders)
+        Folders are filtered lazily while results are consumed, so that a consumer may also simply stop iterating.
+    '''
+    info(f"Search '{_.root}' for tags +<{COMB.join(poss)}> -<{COMB.join(negs)}>")
+    if limit is not None and limit <= 0: return
+    with metrics.phase("find_folders"):
+      paths = _.findFolders(poss, negs, explain = explain)
+      debug(f"Found {len(paths)} potential path matches")
+      if len(paths) == 0 and xany(lambda x: isGlob(x) or DOT in x, negs): paths = _.findFolders([], [], returnAll = True, checkPaths = True)  # for globs and extensions return all folders since filtering happens later
+    metrics.count("candidate_folders", len(paths))
+    if onlyfolders:
+      for p in poss: paths[:] = [x for x in paths if not isGlob(p) or normalizer.globmatch(safeRSplit(x), p)]  # successively reduce paths down to matching positive tags: in --dirs mode tags currently have to be folder names TODO later we should reflect actual mapping
+      for n in negs: paths[:] = [x for x in paths if not isGlob(n) or not normalizer.globmatch(safeRSplit(x), n)]  # TODO is this too strict and ignores configured tags and the index entirely?
+      yield from ((path, None) for path in paths[:limit]); return  # no file filtering requested
+    skipped, count = [], 0
+    def findFiles(path):
+      with metrics.phase("find_files"): return _.findFiles(path, poss, negs)  # accumulated over all folders, also when filtered concurrently
+    for path, (files, skip) in zip(paths, orderedMap(findFiles, paths, jobs)):  # results are evaluated in order, to decide skips like sequentially
+      if skip: skipped.append(path); continue  # memorize prefix to skip all folders under it HINT relies on breadth-first traversal (since ord('.') < ord('/') < ord('A'))
+      if xany(lambda skp: path.startswith(skp), skipped): continue  # is in skipped folder tree HINT if root is skipped, will if course ignore all subfolders as well
+      if limit is not None and count + len(files) >= limit:
+        yield path, set(sorted(files)[:limit - count]); return  # enough results, don't filter any further folders
+      count += len(files)
+      yield path, files
+
   def findFiles(_, current, poss, negs):
     ''' Determine files for the given folder (from findFolders() with potential matchs).
         current: root-relative folder to filter files in
@@ -490,7 +1141,7 @@ class Indexer(object):
         negs:    list of negative (excluding) tags, file extensions, file names or globs
         returns: 2-tuple([filenames], skip?)
     '''
-    debug(f"findFiles '{current}' {poss} {negs}")
+    debug(lambda: f"findFiles '{current}' {poss} {negs}")
     if current: assert current[0] == SLASH and current[-1] not in '/\\' and  _.root[-1] not in '/\\', f"{current} {_.root}"
     inPath = set(safeSplit(current, SLASH))  # break path into folder names
     inPath.update(reduce(lambda prev, step: prev + TOKENIZER.split(step), inPath, []))  # add tokenized path steps
@@ -500,29 +1151,32 @@ class Indexer(object):
     for unique in set(poss): extrap.remove(unique)  # parameters contained more than once:
     for unique in set(negs): extran.remove(unique)  # filter once in folder index, and once more in files
     poss = list(set([p for p in poss if not normalizer.globfilter(inPath, p)])) + extrap  # remove already true positive tags (folder name match)
-    negs += extran
-    info(f"Filter folder '{current}' " + (("by remaining including tags <%s>" % (COMB.join(poss)) if len(poss) else (("by remaining excluding tags " + COMB.join(negs)) if len(negs) else "with no constraint"))))
+    negs = negs + extran  # not in-place, as the caller's list is shared between calls
+    info(lambda: f"Filter folder '{current}' " + (("by remaining including tags <%s>" % (COMB.join(poss)) if len(poss) else (("by remaining excluding tags " + COMB.join(negs)) if len(negs) else "with no constraint"))))
     conf = _.cfg.paths.get(current, {})  # if empty we return all files
     mapped = [pathNorm(m if m.startswith(SLASH) else os.path.normpath(current + SLASH + m)) for m in conf.get(FROM, [])]  # root-absolute or folder-relative path
-    if len(mapped): debug(f"Mapped folders: {os.pathsep.join(mapped)}")  # root-relative paths
+    if len(mapped): debug(lambda: f"Mapped folders: {os.pathsep.join(mapped)}")  # root-relative paths
     skipFilter = len(poss) + len(negs) + len(mapped) == 0
 
     willskip = False  # contains files from current or mapped folders (without path, since "mapped", but could get a local symlink - TODO
+    if skipFilter: metrics.count("scandir_calls")
     found = set() if not skipFilter else set(wrapExc(lambda: [f.name for f in os.scandir(_.root + current) if f.is_file()], []))  # TODO what if folder doesn't exist TODO duplicate of below as special case for no further constraints -> returns all
     if IGNFILE in found: skipFilter, found = True, set()  # enable skip but don't return anything
     for _f, folder in enumerate([] if skipFilter else [current] + mapped):
-      info((f"Check {'mapped' if _f else 'proper'} " + (f"folder '{folder}'") if folder else "root folder"))
+      info(lambda: (f"Check {'mapped' if _f else 'proper'} " + (f"folder '{folder}'") if folder else "root folder"))
+      metrics.count("scandir_calls")
       files = set(wrapExc(lambda: [f.name for f in os.scandir(_.root + folder) if f.is_file()], []))  # TODO silently catches for OS errors, e.g. encoding problems
       if IGNFILE in files: continue  # ignore is easy
       if folder == current and SKPFILE in files:  # only applies to non-mapped folder
         willskip = True  # skip is more difficult to handle than ignore, cf. return 2-tuple (call in tp.find())
-        info(f"Skip '{folder}' due to local marker file")
+        info(lambda: f"Skip '{folder}' due to local marker file")
         continue  # no break, process mapped folders
       caseMapping = dd()  # store mapping from case-normalized to actual filenames
       for f in files: caseMapping[normalizer.filenorm(f)].append(f)
       files.update(set(caseMapping.keys()))  # adds case-normalized file names for matching, used if case_sensitive == False
 
-      tags = _.cfg.paths.get(folder, {}).get(TAG, [])
+      rules = _.tagRules(folder)
+      exists = lambda name: isFile(_.root + folder + os.sep + name)
 
       keep = set(files)  # shallow copy. start with all files to keep, then reduce by remaining matching tag patterns
       for tag in poss:  # for every inclusive tag, check if action on current files is necessary
@@ -531,21 +1185,8 @@ class Indexer(object):
         elif tag in files: keep.intersection_update(set([tag])); continue  # TODO cannot detect tokenized file globs here, we operate only on actual file system contents TODO what if same tag defined in remove
 
         diskeep = set()  # collect all disjunctive "keep" results for configured tag
-        for value in (t for t in tags if t.startswith(tag + SEPA)):  # restrict by additional matching tags from the folder configuration
-          assert value.count(SEPA) == 2
-          tg, inc, exc = value.split(SEPA)  # tag name, includes, excludes
-          conkeep = set(keep)  # all conjunctive filter expressions start with previously filtered set
-          for i in safeSplit(inc):  # keep conjunction of inclusive files
-            if i[0] == DOT: conkeep.intersection_update(set(f for f in conkeep if f[-len(i):] == i))  # TODO also check normalized extension here for user convenience? NO
-            elif  i == ALL: continue  # keep all, nothing to do
-            elif isGlob(i): conkeep.intersection_update(set(normalizer.globfilter(conkeep, i)))  # "set &"
-            else:           conkeep.intersection_update(set([i]) if i in conkeep and isFile(_.root + folder + os.sep + i) else set())  # add file only if exists
-          conrmve = set(keep) if exc else set()  # no excludes mean remove nothing TODO mirror this logic below?
-          for e in safeSplit(exc):  # remove conjunction of exclusive files
-            if e[0] == DOT: conrmve.intersection_update(set(f for f in conrmve if f[-len(e):] == e))
-            elif isGlob(e): conrmve.intersection_update(set(normalizer.globfilter(conrmve, e)))
-            else:           conrmve.intersection_update(set([i]) if i in conrmve and isFile(_.root + folder + os.sep + i) else set())
-          diskeep.update(conkeep - conrmve)  # "set |" disjunctive combination of all filters for a tag
+        for rule in rules.get(tag, ()): diskeep.update(rule.apply(keep, exists))  # restrict by additional matching tags from the folder configuration: "set |" disjunctive combination of all filters for a tag
+        if _.cfg.index_files: diskeep.update(f for f in keep if tag in TOKENIZER.split(f))  # file name tokens are indexed like tags
         keep.intersection_update(diskeep)
         if not keep: break  # no need to further check, if no matches remain after tag
 
@@ -555,29 +1196,16 @@ class Indexer(object):
         elif isGlob(tag):  remove.intersection_update(set(normalizer.globfilter(files, tag))); continue  # filter globs
         elif tag in files: remove.intersection_update(set([tag])); continue
 
-        disremove = set()
-        for value in (t for t in tags if t.startswith(tag + SEPA)):
-          assert value.count(SEPA) == 2
-          tg, inc, exc = value.split(SEPA)
-          conremove = set(remove)  # collect all file that should be excluded
-          for i in safeSplit(inc):
-            if i[0] == DOT: conremove.intersection_update(set(f for f in conremove if normalizer.filenorm(f[-len(i):]) == normalizer.filenorm(i)))
-            elif  i == ALL: continue
-            elif isGlob(i): conremove.intersection_update(set(normalizer.globfilter(conremove, i)))
-            else:           conremove.intersection_update(set([i]) if i in conremove and isFile(_.root + folder + os.sep + i) else set())
-          conkeep = set(remove) if exc else set()
-          for e in safeSplit(exc):
-            if e[0] == DOT: conkeep.intersection_update(set(f for f in conkeep if normalizer.filenorm(f[-len(e):])))
-            elif isGlob(e): conkeep.intersection_update(set(normalizer.globfilter(conkeep, e)))
-            else:           conkeep.intersection_update(set([i]) if i in conkeep and isFile(_.root + folder + os.sep + i) else set())
-          disremove.update(conremove - conkeep)
+        disremove = set()  # collect all files that should be excluded
+        for rule in rules.get(tag, ()): disremove.update(rule.apply(remove, exists, normalized = True))
+        if _.cfg.index_files: disremove.update(f for f in remove if tag in TOKENIZER.split(f))
         remove.intersection_update(disremove)
         if not remove: break
       files.intersection_update(keep)
       files.difference_update(remove)
-      debug(f"Files for folder '{folder}': {COMB.join(files)} (Keep/Remove: <{COMB.join(keep - remove)}>/<{COMB.join(remove)}>)")
+      debug(lambda: f"Files for folder '{folder}': {COMB.join(files)} (Keep/Remove: <{COMB.join(keep - remove)}>/<{COMB.join(remove)}>)")
       found.update(set(reduce(lambda l, f: lappend(l, caseMapping.get(f, f)), files, set())))  # TODO may lead to different cases or shadowing if using mapped dirs
-    debug(f"findFiles '{current}' returns {list(found)} skip: {willskip}")  # TODO in contrast to findFolder no file exist checks (mapped entries are harder to check). ? only partially with config TAGS
+    debug(lambda: f"findFiles '{current}' returns {list(found)} skip: {willskip}")  # TODO in contrast to findFolder no file exist checks (mapped entries are harder to check). ? only partially with config TAGS
     return found, willskip
 
 
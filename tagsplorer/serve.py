@@ -0,0 +1,108 @@
+# coding=utf-8
+
+''' tagsPlorer resident query server  (C) 2021-2021  Arne Bachmann  https://github.com/ArneBachmann/tagsplorer '''
+
+import json, logging, os, sys, urllib.error, urllib.parse, urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from tagsplorer.constants import COMB, CONFIG, DOT, INDEX
+from tagsplorer.lib import Indexer
+from tagsplorer.utils import normalizer, removeTagPrefixes, sjoin, splitByPredicate, splitTags, wrapExc
+
+
+_log = logging.getLogger(__name__)
+def log(level): return (lambda *s: _log.isEnabledFor(level) and _log.log(level, sjoin([_() if callable(_) else _ for _ in s]), **({"stacklevel": 2} if sys.version_info >= (3, 8) else {})))  # callable arguments are only evaluated if the level is enabled
+debug, info, warn, error = log(logging.DEBUG), log(logging.INFO), log(logging.WARNING), log(logging.ERROR)
+
+
+class Server(HTTPServer):
+  ''' Localhost HTTP server that keeps the index in memory and answers search requests.
+      The index is re-loaded only if the configuration or index file was modified since.
+      Requests are answered one after another, as the index and the case normalizer are shared.
+      GET /search?tags=<tag1,-tag2>[&dirs=true][&ignore_case=true][&limit=<n>] returns {"root": <folder>, "folders": [<path>, ...]} for dirs=true,
+      otherwise {"root": <folder>, "files": [[<path>, [<file>, ...]], ...]} with root-relative folder paths.
+  '''
+
+  def __init__(_, root, meta, port, keep_index = False, jobs = 1):
+    ''' root:       absolute path of the indexed folder tree
+        meta:       absolute path of the folder containing configuration and index files
+        port:       localhost port to listen on, 0 to pick any free port
+        keep_index: if True, don't re-create the index on configuration changes, cf. --keep-index
+        jobs:       number of threads for scanning folders when re-creating the index, and for filtering files
+    '''
+    _.root, _.meta, _.keep_index, _.jobs = root, meta, keep_index, jobs
+    _.idx, _.stamps = None, None
+    super().__init__(("127.0.0.1", port), Handler)
+
+  def fileStamps(_): return tuple(wrapExc(lambda: os.stat(os.path.join(_.meta, name)).st_mtime_ns) for name in (CONFIG, INDEX))
+
+  def index(_):
+    ''' Return the loaded index, re-loading it if files were modified since the last request. '''
+    stamps = _.fileStamps()
+    if _.idx is None or stamps != _.stamps:
+      if stamps[1] is None: raise FileNotFoundError("No index file found. Run 'tp -U' first")
+      info("Load index" + (" after file modification" if _.idx else ""))
+      idx = Indexer(_.root)
+      idx.load(os.path.join(_.meta, INDEX), ignore_skew = _.keep_index, jobs = _.jobs)  # may re-create and store the index
+      _.idx, _.stamps = idx, _.fileStamps()
+    return _.idx
+
+  def search(_, tags, onlyfolders = False, ignore_case = False, limit = None):
+    ''' Search the index like "tp <tags>".
+        tags:    list of comma-separated tag arguments with optional +/- prefixes
+        limit:   maximum number of files (or folders if onlyfolders) to return
+        returns: dictionary for the JSON response
+    '''
+    idx = _.index()
+    poss, negs = removeTagPrefixes(*splitByPredicate(splitTags(tags), lambda e: e[0] != '-'))
+    normalizer.setupCasematching(not (ignore_case or not idx.cfg.case_sensitive), suppress = True)
+    poss, negs = map(lambda l: list(map(normalizer.filenorm, l)), (poss, negs))
+    _exts = [ext for ext in poss + negs if ext and ext[0] == DOT]
+    if len(_exts) > 1: raise ValueError(f"Cannot match anything if more than one file extension is specified ({COMB.join(_exts)})")
+    results = idx.search(poss, negs, onlyfolders = onlyfolders, jobs = _.jobs, limit = limit)
+    if onlyfolders: return {"root": idx.root, "folders": [path for path, files in results]}
+    return {"root": idx.root, "files": [[path, sorted(files)] for path, files in results if files]}
+
+
+class Handler(BaseHTTPRequestHandler):
+  ''' Request handler for the Server. '''
+
+  def do_GET(_):
+    url = urllib.parse.urlparse(_.path)
+    if url.path != "/search": return _.reply(404, {"error": f"Unknown request '{url.path}'"})
+    query = urllib.parse.parse_qs(url.query)
+    flag = lambda key: query.get(key, ["false"])[0].lower() == "true"
+    try: _.reply(200, _.server.search(query.get("tags", []), onlyfolders = flag("dirs"), ignore_case = flag("ignore_case"), limit = int(query["limit"][0]) if "limit" in query else None))
+    except ValueError as E: _.reply(400, {"error": str(E)})
+    except Exception as E: error(E); _.reply(500, {"error": str(E)})
+
+  def reply(_, code, data):
+    body = json.dumps(data).encode("utf-8")
+    _.send_response(code)
+    _.send_header("Content-Type", "application/json; charset=utf-8")
+    _.send_header("Content-Length", str(len(body)))
+    _.end_headers()
+    _.wfile.write(body)
+
+  def log_message(_, format, *args): debug(format % args)  # instead of writing to stderr
+
+
+def query(port, tags, onlyfolders = False, ignore_case = False, limit = None):
+  ''' Thin client that sends a search request to a running server.
+      returns: decoded JSON response, cf. Server
+  '''
+  url = f"http://127.0.0.1:{port}/search?" + urllib.parse.urlencode(dict({"tags": COMB.join(tags), "dirs": str(onlyfolders).lower(), "ignore_case": str(ignore_case).lower()}, **({"limit": limit} if limit is not None else {})))
+  debug(f"Query {url}")
+  try:
+    with urllib.request.urlopen(url) as response: return json.loads(response.read().decode("utf-8"))
+  except urllib.error.HTTPError as E: raise Exception(json.loads(E.read().decode("utf-8"))["error"])
+
+
+def main():
+  ''' Console entry point: same as "tp --serve". '''
+  if '--serve' not in sys.argv: sys.argv.insert(1, '--serve')
+  from tagsplorer import tp
+  tp.main()
+
+
+if __name__ == '__main__': main()
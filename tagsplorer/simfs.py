@@ -1,6 +1,6 @@
 ''' tagsPlorer file system emulation  (C) 2016-2021  Arne Bachmann  https://github.com/ArneBachmann/tagsplorer '''
 
-import doctest, logging, os, sys, unittest
+import collections, doctest, logging, os, sys, unittest
 
 
 _log = logging.getLogger(__name__)
@@ -15,6 +15,44 @@ if '--simulate-winfs' in sys.argv or os.environ.get("SIMULATE_WINFS", "false").l
 
   SIMFS = True
   _RIGHTS = 0o777
+  _LISTINGS = 1024  # maximum number of cached folder listings
+
+
+  class ListingCache(object):
+    ''' Bounded least-recently-used cache of folder listings for _realPath(), which otherwise lists the parent folder of each path step for every file system call.
+        The patched modifying functions invalidate the affected listings. Modifications bypassing them (e.g. the built-in open) go unnoticed, unless they only add names in the given letter case.
+    >>> c = ListingCache(2)
+    >>> print(("tagsplorer" in c.get("."), "tagsplorer" in c.get("."), c.hits, c.misses))
+    (True, True, 1, 1)
+    >>> for folder in ("tagsplorer", "_test-data", "."): _ = c.get(folder)
+    >>> print((c.hits, c.misses, len(c.listings)))
+    (1, 4, 2)
+    >>> c.invalidate("./_test-data/a"); print(len(c.listings))
+    1
+    '''
+
+    def __init__(_, size = _LISTINGS): _.size, _.listings, _.hits, _.misses = size, collections.OrderedDict(), 0, 0
+
+    @staticmethod
+    def key(folder): return _normpath(os.path.join(os.getcwd(), folder))  # the unpatched function
+
+    def get(_, folder):
+      ''' Return the names in a folder. Raises OSError like os.listdir(). '''
+      key = ListingCache.key(folder)
+      names = _.listings.get(key)
+      if names is not None: _.hits += 1; _.listings.move_to_end(key); return names
+      _.misses += 1
+      names = _.listings[key] = _listdir(folder)
+      if len(_.listings) > _.size: _.listings.popitem(last = False)  # remove least recently used
+      return names
+
+    def invalidate(_, path):
+      ''' Forget the listings of a modified path's parent folder, the path itself, and all folders below. '''
+      key = ListingCache.key(path)
+      for k in [k for k in _.listings if k == key or k.startswith(key + os.sep)]: del _.listings[k]
+      _.listings.pop(os.path.dirname(key), None)
+
+    def clear(_): _.listings.clear()
 
   def _realPath(path):
     ''' Central function that determines the actual file name case for the given folder or file path.
@@ -60,7 +98,7 @@ if '--simulate-winfs' in sys.argv or os.environ.get("SIMULATE_WINFS", "false").l
     if absolute: steps.pop(0)
     real = '' if absolute else '.'
     for step in steps:
-      try: files = _listdir(real if real else '/')
+      try: files = _listings.get(real if real else '/')
       except: real += SLASH + step; continue  # cannot access: continue with path as given
       found = [f for f in files if f.lower() == step.lower()]  # match case-normalized
       if len(found) != 1:
@@ -70,16 +108,24 @@ if '--simulate-winfs' in sys.argv or os.environ.get("SIMULATE_WINFS", "false").l
     return real
 
 
+  _listdir, _normpath = os.listdir, os.path.normpath  # unpatched functions used by ListingCache
+  _listings = ListingCache()
+
+  def _modifying(func):
+    ''' Wrap a patched file system function to invalidate the cached listings for its path argument. '''
+    def modify(path, *args, **kwargs):
+      real = _realPath(path)
+      try: return func(real, *args, **kwargs)
+      finally: _listings.invalidate(real)
+    return modify
+
   _exists = os.path.exists
   def __exists(path): return wrapExc(lambda: _exists(_realPath(path)), False)  # also for file handles
   os.path.exists = __exists  # monkey-patch function
 
   _unlink, _remove = os.unlink, os.remove  # could be the same, but just in case
-  def __unlink(path): return _unlink(_realPath(path))
-  def __remove(path): return _remove(_realPath(path))
-  os.unlink, os.remove = __unlink, __remove
+  os.unlink, os.remove = _modifying(_unlink), _modifying(_remove)
 
-  _normpath = os.path.normpath
   def __normpath(path): return _normpath(_realPath(path))  # in Coconut: def os.path.isdir = ...
   os.path.normpath = __normpath
 
@@ -100,7 +146,6 @@ if '--simulate-winfs' in sys.argv or os.environ.get("SIMULATE_WINFS", "false").l
   def __lstat(path): return _lstat(_realPath(path))
   os.stat, os.lstat = __stat, __lstat
 
-  _listdir = os.listdir
   def __listdir(path): return _listdir(_realPath(path))
   os.listdir = __listdir
 
@@ -112,6 +157,7 @@ if '--simulate-winfs' in sys.argv or os.environ.get("SIMULATE_WINFS", "false").l
       _.path = path
       _.mode = mode
       _.fd = _open(_realPath(path), mode)
+      if set(mode) & set("wax+"): _listings.invalidate(_realPath(path))  # may have created a file
 
     def __enter__(_):
       _log.debug("Entering patched 'open' context manager")
@@ -136,18 +182,27 @@ if '--simulate-winfs' in sys.argv or os.environ.get("SIMULATE_WINFS", "false").l
   os.chdir = __chdir
 
   _mkdir = os.mkdir
-  def __mkdir(path, mode = _RIGHTS): return _mkdir(_realPath(path), mode)
-  os.mkdir = __mkdir
+  def __mkdir(path, mode = _RIGHTS): return _mkdir(path, mode)
+  os.mkdir = _modifying(__mkdir)
 
   _rmdir = os.rmdir
-  def __rmdir(path): return _rmdir(_realPath(path))
-  os.rmdir = __rmdir
+  os.rmdir = _modifying(_rmdir)
 
   _makedirs = os.makedirs
   def __makedirs(path, mode = _RIGHTS, exist_ok = False):
-    return _makedirs(_realPath(path), mode = mode, exist_ok = exist_ok)
+    try: return _makedirs(_realPath(path), mode = mode, exist_ok = exist_ok)
+    finally: _listings.clear()  # may have created several folder levels
   os.makedirs = __makedirs
 
+  _rename, _replace = os.rename, os.replace  # not patched for letter case, but modify listings
+  def __rename(src, dst, *args, **kwargs):
+    try: return _rename(src, dst, *args, **kwargs)
+    finally: _listings.invalidate(src); _listings.invalidate(dst)
+  def __replace(src, dst, *args, **kwargs):
+    try: return _replace(src, dst, *args, **kwargs)
+    finally: _listings.invalidate(src); _listings.invalidate(dst)
+  os.rename, os.replace = __rename, __replace
+
 
   class TestRepoTestCase(unittest.TestCase):
     def testStuff(_):
@@ -184,6 +239,19 @@ if '--simulate-winfs' in sys.argv or os.environ.get("SIMULATE_WINFS", "false").l
       os.rmdir("_test-data/tmp2")
       _.assertFalse(os.path.exists("./_test-data/tmp2"))
 
+    def testListingCache(_):
+      hits = _listings.hits
+      _.assertTrue(os.path.isfile("_test-data/D/A.B")); _.assertTrue(os.path.isfile("_TEST-data/d/a.b"))
+      _.assertGreater(_listings.hits, hits)  # second resolution uses the cached listings
+      with open("_test-data/d/Tmp", "w"): pass
+      _.assertTrue(os.path.exists("_test-data/d/tMP"))  # listing invalidated by writing
+      os.unlink("_test-data/d/TMP")
+      _.assertFalse(os.path.exists("_test-data/d/Tmp"))
+      os.mkdir("_test-data/Tmp3")
+      _.assertTrue(os.path.isdir("_test-data/tmp3"))
+      os.rmdir("_test-data/TMP3")
+      _.assertFalse(os.path.isdir("_test-data/Tmp3"))
+
 
   def load_tests(loader, tests, ignore):
     ''' Queried by unittest. '''
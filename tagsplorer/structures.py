@@ -0,0 +1,374 @@
+''' tagsPlorer index data structures  (C) 2021-2021  Arne Bachmann  https://github.com/ArneBachmann/tagsplorer '''
+
+import bz2, lzma, marshal, mmap, pickle, struct, sys, time, zlib
+from array import array
+from collections.abc import Mapping
+
+from tagsplorer.constants import CODEC_MAGIC, INDEX_READ_RATE, MAPPED_MAGIC, PICKLE_PROTOCOL
+
+
+class StringTable(object):
+  ''' Read-only list of strings, stored as one UTF-8 encoded byte string plus an array of offsets.
+      Avoids one Python object per list entry, at the expense of decoding entries on access.
+  >>> t = StringTable(["", "a", "bc", "ä"])
+  >>> print((len(t), t[0], t[2], t[3], list(t)))
+  (4, '', 'bc', 'ä', ['', 'a', 'bc', 'ä'])
+  >>> print((t.index("bc"), t.count("a")))
+  (2, 1)
+  >>> print(list(StringTable.fromBuffers(t.offsets, memoryview(t.data))))
+  ['', 'a', 'bc', 'ä']
+  '''
+
+  def __init__(_, strings):
+    _.offsets = array('I', [0])  # entry i is stored at data[offsets[i]:offsets[i + 1]]
+    encoded = []
+    for s in strings:
+      encoded.append(s.encode("utf-8", "surrogatepass"))  # allows any file name, even with undecodable bytes
+      _.offsets.append(_.offsets[-1] + len(encoded[-1]))
+    _.data = b"".join(encoded)
+
+  @classmethod
+  def fromBuffers(cls, offsets, data):
+    ''' Wrap existing buffers (e.g. views into a memory-mapped file) without copying them. '''
+    table = cls.__new__(cls)
+    table.offsets, table.data = offsets, data
+    return table
+
+  def __len__(_): return len(_.offsets) - 1
+
+  def __getitem__(_, i): return str(_.data[_.offsets[i]:_.offsets[i + 1]], "utf-8", "surrogatepass")
+
+  def __iter__(_): return (_[i] for i in range(len(_)))
+
+  def index(_, value):
+    for i, s in enumerate(_):
+      if s == value: return i
+    raise ValueError(f"'{value}' is not in table")
+
+  def count(_, value): return sum(1 for s in _ if s == value)
+
+
+class Postings(object):
+  ''' Read-only list of sorted posting lists (compressed sparse row format), stored as one flat array of integers plus an array of offsets.
+  >>> p = Postings([{3, 1}, set(), [2]])
+  >>> print((len(p), list(p[0]), list(p[1]), list(p[2]), p.size(0)))
+  (3, [1, 3], [], [2], 2)
+  >>> print([list(_) for _ in p])
+  [[1, 3], [], [2]]
+  '''
+
+  def __init__(_, lists):
+    _.offsets = array('I', [0])  # posting list i is stored at values[offsets[i]:offsets[i + 1]]
+    _.values  = array('I')
+    for ids in lists:
+      _.values.extend(sorted(ids))
+      _.offsets.append(len(_.values))
+
+  @classmethod
+  def fromBuffers(cls, offsets, values):
+    ''' Wrap existing integer buffers (e.g. views into a memory-mapped file) without copying them. '''
+    postings = cls.__new__(cls)
+    postings.offsets, postings.values = offsets, values
+    return postings
+
+  def __len__(_): return len(_.offsets) - 1
+
+  def __getitem__(_, i): return _.values[_.offsets[i]:_.offsets[i + 1]]
+
+  def __iter__(_): return (_[i] for i in range(len(_)))
+
+  def size(_, i):
+    ''' Number of entries of posting list i, without copying it. '''
+    return _.offsets[i + 1] - _.offsets[i]
+
+
+class NameIndex(Mapping):
+  ''' Read-only dictionary of names, stored sorted by their UTF-8 encoding in a string table for binary search, with values at the same positions.
+  >>> n = NameIndex.build({"b": 2, "ä": 3, "a": 1})
+  >>> print((len(n), n["a"], n.get("ä"), n.get("c"), "b" in n, list(n)))
+  (3, 1, 3, None, True, ['a', 'b', 'ä'])
+  '''
+
+  def __init__(_, names, values):
+    ''' names:  StringTable sorted by UTF-8 encoding
+        values: indexable sequence with the value for each name position
+    '''
+    _.names, _.values = names, values
+
+  @staticmethod
+  def sortedNames(names): return sorted(names, key = lambda name: name.encode("utf-8", "surrogatepass"))
+
+  @classmethod
+  def build(cls, dictionary):
+    names = NameIndex.sortedNames(dictionary)
+    return cls(StringTable(names), [dictionary[name] for name in names])
+
+  def find(_, name):
+    ''' Return position of name in the table, or -1 if not contained. '''
+    key, offsets, data = name.encode("utf-8", "surrogatepass"), _.names.offsets, _.names.data
+    lo, hi = 0, len(_.names)
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if bytes(data[offsets[mid]:offsets[mid + 1]]) < key: lo = mid + 1
+      else: hi = mid
+    return lo if lo < len(_.names) and bytes(data[offsets[lo]:offsets[lo + 1]]) == key else -1
+
+  def __getitem__(_, name):
+    pos = _.find(name)
+    if pos < 0: raise KeyError(name)
+    return _.values[pos]
+
+  def __iter__(_): return iter(_.names)
+
+  def __len__(_): return len(_.names)
+
+
+def idsToBits(ids):
+  ''' Convert integer ids into a bitset, represented as a Python integer with bit i set for id i.
+      Bitsets allow set algebra over many ids in few machine instructions: & for intersection, & ~ for difference, | for union.
+  >>> print(bin(idsToBits([0, 3, 3, 9])))
+  0b1000001001
+  >>> print(idsToBits([]))
+  0
+  '''
+  buf = bytearray()
+  for i in ids:
+    byte = i >> 3
+    if byte >= len(buf): buf.extend(bytes(byte + 1 - len(buf)))
+    buf[byte] |= 1 << (i & 7)
+  return int.from_bytes(buf, "little")
+
+
+def bitsToIds(bits):
+  ''' Generate the ids of all set bits in ascending order.
+  >>> print(list(bitsToIds(idsToBits([9, 0, 3]))))
+  [0, 3, 9]
+  >>> print(list(bitsToIds(0)))
+  []
+  '''
+  digits = bin(bits)[:1:-1]  # least significant bit first
+  i = digits.find("1")
+  while i >= 0:
+    yield i
+    i = digits.find("1", i + 1)
+
+
+def bitCount(bits):
+  ''' Number of set bits.
+  >>> print(bitCount(idsToBits([1, 5, 7])))
+  3
+  '''
+  return bin(bits).count("1")
+
+
+def nameTrigrams(name):
+  ''' Determine all three-letter substrings of a case-normalized name, padded with "\\0" to mark its beginning and end.
+  >>> print(sorted(nameTrigrams("Abcd")))
+  ['\\x00ab', 'abc', 'bcd', 'cd\\x00']
+  >>> print(sorted(nameTrigrams("")))
+  ['\\x00\\x00']
+  '''
+  padded = "\0" + name.lower() + "\0"
+  return set(padded[i:i + 3] for i in range(max(1, len(padded) - 2)))
+
+
+def globTrigrams(glob):
+  ''' Determine the trigrams every name matching the glob must contain, from the glob's literal character runs.
+      Matching is case-insensitive, to serve as a pre-filter for both case-sensitive and case-insensitive glob matching.
+  >>> print(sorted(globTrigrams("*proj*")))
+  ['pro', 'roj']
+  >>> print(sorted(globTrigrams(".x??")))
+  ['\\x00.x']
+  >>> print(sorted(globTrigrams("a[bc]d*")))
+  []
+  >>> print(sorted(globTrigrams("[!x]*Ab")))
+  ['ab\\x00']
+  >>> print(sorted(globTrigrams("[]ab")))
+  ['\\x00[]', '[]a', ']ab', 'ab\\x00']
+  '''
+  runs, run, i, glob = [], "\0", 0, glob.lower()  # leading literal characters are anchored at the beginning of the name
+  while i < len(glob):
+    c, j = glob[i], i + 1
+    if c == "[":  # find end of character set like fnmatch does: "]" directly after "[" or "[!" is part of the set
+      if glob[j:j + 1] == "!": j += 1
+      if glob[j:j + 1] == "]": j += 1
+      j = glob.find("]", j) + 1  # 0 if unclosed, making "[" a literal character
+    if c in "*?" or (c == "[" and j): runs.append(run); run = ""  # wildcard ends the literal run
+    else: run += c; j = i + 1
+    i = j
+  runs.append(run + "\0")  # trailing literal characters are anchored at the end of the name
+  return set(run[i:i + 3] for run in runs for i in range(len(run) - 2))
+
+
+class IndexCodec(object):
+  ''' Serialization plus optional compression of index files that are loaded entirely (i.e. not memory-mapped).
+      Specified as "<serializer>+<compressor>[:<level>]" with serializer "pickle" or "marshal" and compressor "zlib", "lzma", "bz2" or "none".
+      The serializer defaults to pickle, the level to the compressor's default, e.g. "bz2" means "pickle+bz2:9".
+      Marshal only encodes built-in types (cf. Indexer.plain()), but decodes faster than pickle.
+  >>> c = IndexCodec("marshal+lzma")
+  >>> print((c.spec, c.loads(c.dumps({"a": [1, (2, b"3")]}))))
+  ('marshal+lzma:6', {'a': [1, (2, b'3')]})
+  >>> print((IndexCodec("BZ2").spec, IndexCodec("pickle").spec, IndexCodec("marshal+none").spec))
+  ('pickle+bz2:9', 'pickle', 'marshal')
+  >>> IndexCodec("json")
+  Traceback (most recent call last):
+  ...
+  ValueError: Unknown index codec 'json'
+  '''
+
+  SERIALIZERS = {  # name -> (serialize(object), deserialize(data))
+    "pickle":  (lambda obj: pickle.dumps(obj, protocol = PICKLE_PROTOCOL), pickle.loads),
+    "marshal": (lambda obj: marshal.dumps(obj, 4), marshal.loads)
+  }
+  COMPRESSORS = {  # name -> (compress(data, level), decompress(data), default level)
+    "zlib": (zlib.compress, zlib.decompress, 2),
+    "lzma": (lambda data, level: lzma.compress(data, preset = level), lzma.decompress, 6),
+    "bz2":  (bz2.compress, bz2.decompress, 9)
+  }
+  CANDIDATES = ("pickle", "zlib:1", "zlib:2", "zlib:6", "bz2:9", "lzma:6", "marshal", "marshal+zlib:1", "marshal+zlib:2", "marshal+lzma:6")  # benchmarked by select()
+
+  def __init__(_, spec):
+    parts = spec.strip().lower().split("+")
+    _.serializer = parts.pop(0) if parts[0] in IndexCodec.SERIALIZERS else "pickle"
+    name, sep, level = (parts[0] if parts else "none").partition(":")
+    if len(parts) > 1 or (name not in IndexCodec.COMPRESSORS and not (name == "none" and not sep)) or (sep and not level.isdigit()): raise ValueError(f"Unknown index codec '{spec}'")
+    _.compressor, _.level = (name, int(level) if sep else IndexCodec.COMPRESSORS[name][2]) if name != "none" else (None, None)
+    _.spec = _.serializer + (f"+{_.compressor}:{_.level}" if _.compressor else "")
+
+  def serialize(_, obj): return IndexCodec.SERIALIZERS[_.serializer][0](obj)
+
+  def deserialize(_, data): return IndexCodec.SERIALIZERS[_.serializer][1](data)
+
+  def compress(_, data): return IndexCodec.COMPRESSORS[_.compressor][0](data, _.level) if _.compressor else data
+
+  def decompress(_, data): return IndexCodec.COMPRESSORS[_.compressor][1](data) if _.compressor else data
+
+  def dumps(_, obj): return _.compress(_.serialize(obj))
+
+  def loads(_, data): return _.deserialize(_.decompress(data))
+
+  def header(_): return CODEC_MAGIC + _.spec.encode("ascii") + b"\n"
+
+  @staticmethod
+  def read(fd):
+    ''' Determine the codec of an index file from its header.
+        fd:      file opened in binary mode, positioned at its beginning
+        returns: codec with the file positioned after the header, or None for files written without header (zlib-compressed or plain pickle) with the file positioned at its beginning
+    '''
+    magic = fd.read(len(CODEC_MAGIC))
+    if magic == CODEC_MAGIC: return IndexCodec(fd.readline().decode("ascii"))
+    if magic[:-1] == CODEC_MAGIC[:-1]: raise ValueError("Unsupported index file version. Re-create the index via 'tp -U'")
+    fd.seek(0)
+    return None
+
+  @staticmethod
+  def select(payloads, rate = INDEX_READ_RATE, candidates = CANDIDATES, repeat = 3):
+    ''' Benchmark codecs on the actual index contents, and choose the one with the shortest expected load time.
+        payloads: dictionary from serializer name to the object to serialize with it. codecs for other serializers are skipped
+        rate:     expected read throughput of the index file in MB/s: low values (network drives, spinning disks) favor smaller files, high values (SSDs) faster decoding
+        returns:  2-tuple(best codec, list of 4-tuple(codec specification, encoded bytes, decoding seconds, expected load seconds) sorted by expected load seconds)
+    >>> codec, results = IndexCodec.select({"pickle": list(range(1000))}, repeat = 1)
+    >>> print((codec.serializer, len(results), codec.spec == results[0][0]))
+    ('pickle', 6, True)
+    '''
+    serialized, results = {}, []
+    for spec in candidates:
+      codec = IndexCodec(spec)
+      if codec.serializer not in payloads: continue
+      if codec.serializer not in serialized: serialized[codec.serializer] = codec.serialize(payloads[codec.serializer])
+      data = codec.compress(serialized[codec.serializer])
+      durations = []
+      for i in range(repeat):
+        start = time.perf_counter()
+        codec.loads(data)
+        durations.append(time.perf_counter() - start)
+      results.append((codec.spec, len(data), min(durations), len(data) / (rate * 1e6) + min(durations)))
+    results.sort(key = lambda result: result[3])
+    return IndexCodec(results[0][0]), results
+
+
+class MappedIndex(object):
+  ''' Read-only index file that is accessed via memory mapping, to answer queries without decoding the entire index first.
+      Layout: a fixed header (magic bytes, byte order, start offset and length of each section), followed by the sections in SECTIONS order.
+      All integer arrays are stored as unsigned 32 bit integers in the byte order of the writing machine, aligned to 8 bytes.
+      Only the small metadata section is decoded when opening; names are found via binary search, and posting lists are sliced on access.
+  '''
+
+  SECTIONS = ("meta", "scans", "tagdirs.offsets", "tagdirs.data", "parents", "paths.offsets", "paths.values", "names.offsets", "names.data", "name2tagdir", "name2tagdirs.offsets", "name2tagdirs.values", "trigrams.offsets", "trigrams.data", "trigram2names.offsets", "trigram2names.values", "aliases")
+  HEADER = struct.Struct("<%ds2s%dQ" % (len(MAPPED_MAGIC), 2 * len(SECTIONS)))  # magic, byte order, section start offsets and lengths
+
+  def __init__(_, fd):
+    ''' fd: file opened in binary mode. The mapping stays valid after the file is closed. '''
+    _.mm = mmap.mmap(fd.fileno(), 0, access = mmap.ACCESS_READ)
+    magic, order, *bounds = MappedIndex.HEADER.unpack_from(_.mm)
+    if magic != MAPPED_MAGIC: raise ValueError("Unsupported memory-mapped index file version. Re-create the index via 'tp -U'")
+    view = memoryview(_.mm)
+    section = dict(zip(MappedIndex.SECTIONS, (view[start:start + length] for start, length in zip(bounds[::2], bounds[1::2]))))
+    swap = order.decode("ascii") != sys.byteorder[0] * 2
+    ints = lambda name: MappedIndex.ints(section[name], swap)
+    _.cfg, _.timestamp = pickle.loads(section["meta"])
+    _.scansData   = section["scans"]
+    _.tagdirs       = StringTable.fromBuffers(ints("tagdirs.offsets"), section["tagdirs.data"])
+    _.tagdir2parent = ints("parents")
+    _.tagdir2paths  = Postings.fromBuffers(ints("paths.offsets"), ints("paths.values"))
+    names = StringTable.fromBuffers(ints("names.offsets"), section["names.data"])
+    _.name2tagdir   = NameIndex(names, ints("name2tagdir"))
+    _.name2tagdirs  = NameIndex(names, Postings.fromBuffers(ints("name2tagdirs.offsets"), ints("name2tagdirs.values")))
+    _.trigrams      = NameIndex(StringTable.fromBuffers(ints("trigrams.offsets"), section["trigrams.data"]), Postings.fromBuffers(ints("trigram2names.offsets"), ints("trigram2names.values")))
+    _.aliases       = ints("aliases")
+
+  @staticmethod
+  def ints(view, swap):
+    ''' Interpret a section as unsigned integers, converting to an in-memory array only if written on a machine with different byte order. '''
+    if not swap: return view.cast('I')
+    values = array('I', bytes(view)); values.byteswap()
+    return values
+
+  def scans(_):
+    ''' Decode the folder listings of the last walk, only needed for incremental updates. '''
+    return pickle.loads(zlib.decompress(_.scansData))
+
+  @staticmethod
+  def write(fd, cfg, timestamp, tagdirs, tagdir2parent, tagdir2paths, name2tagdirs, trigrams, aliases, scans, compression):
+    ''' Write an index in memory-mapped format.
+        fd: file opened for binary writing
+        tagdirs, tagdir2parent, tagdir2paths: in regular or compact representation
+        name2tagdirs: dictionary from names to all their tagdir indices (name2tagdir is derived from it)
+        trigrams: dictionary from trigrams to the first tagdir indices of all names containing them
+        aliases: tagdir indices of case-normalized copies of folder names
+        scans: folder listings of the last walk
+    '''
+    tagdirs = tagdirs if isinstance(tagdirs, StringTable) else StringTable(tagdirs)
+    paths = tagdir2paths if isinstance(tagdir2paths, Postings) else Postings(tagdir2paths)
+    names = NameIndex.sortedNames(name2tagdirs)
+    table = StringTable(names)
+    all_ = Postings([name2tagdirs[name] for name in names])
+    grams = NameIndex.sortedNames(trigrams)
+    grams, gram2names = StringTable(grams), Postings([trigrams[gram] for gram in grams])
+    sections = [
+      pickle.dumps((cfg, timestamp), protocol = PICKLE_PROTOCOL),
+      zlib.compress(pickle.dumps(scans, protocol = PICKLE_PROTOCOL), compression or 1),
+      tagdirs.offsets, tagdirs.data,
+      array('I', tagdir2parent),
+      paths.offsets, paths.values,
+      table.offsets, table.data,
+      array('I', [all_.values[all_.offsets[i]] for i in range(len(all_))]),  # first index of each name
+      all_.offsets, all_.values,
+      grams.offsets, grams.data,
+      gram2names.offsets, gram2names.values,
+      array('I', aliases)
+    ]
+    sections = [bytes(s) if not isinstance(s, array) else s.tobytes() for s in sections]
+    bounds, start = [], (MappedIndex.HEADER.size + 7) // 8 * 8
+    for s in sections: bounds.extend([start, len(s)]); start += (len(s) + 7) // 8 * 8  # align all sections for integer access
+    fd.write(MappedIndex.HEADER.pack(MAPPED_MAGIC, (sys.byteorder[0] * 2).encode("ascii"), *bounds))
+    fd.write(b"\0" * (-MappedIndex.HEADER.size % 8))
+    for s in sections: fd.write(s); fd.write(b"\0" * (-len(s) % 8))
+
+  def close(_):
+    ''' Unmap the file, if no views into it are in use anymore. Otherwise it is unmapped once garbage-collected. '''
+    try: _.mm.close()
+    except BufferError: pass
+
+
+if __name__ == '__main__': import doctest; doctest.testmod()
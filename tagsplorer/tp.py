@@ -5,10 +5,11 @@
 import logging, optparse, os, sys, time
 assert sys.version_info >= (3, 6), "tagsPlorer requires Python 3.6+"
 
-from tagsplorer.constants import ALL, APPNAME, COMB, CONFIG, DOT, FROM, GLOBAL, IGNORED, IGNOREDS, INDEX, NL, RIGHTS, SKIPD, SKIPDS, SLASH, ST_MTIME
+from tagsplorer.constants import ALL, APPNAME, COMB, CONFIG, DOT, FROM, GLOBAL, IGNORED, IGNOREDS, INDEX, INDEX_READ_RATE, NL, RIGHTS, SERVE_PORT, SKIPD, SKIPDS, SLASH, ST_MTIME
 from tagsplorer.lib import Configuration, Indexer
-from tagsplorer.utils import caseCompareKey, casefilter, dd, dictGetSet, isDir, isGlob, isUnderRoot, lindex, normalizer, pathNorm, removeTagPrefixes, safeRSplit, safeSplit, sjoin, splitByPredicate, splitTags, wrapExc, xany
-from tagsplorer import lib, simfs, utils  # for setting the log level dynamically
+from tagsplorer.structures import IndexCodec
+from tagsplorer.utils import caseCompareKey, casefilter, dd, dictGetSet, isDir, isGlob, isUnderRoot, lindex, metrics, normalizer, pathNorm, removeTagPrefixes, safeSplit, sjoin, splitByPredicate, splitTags, wrapExc, xany
+from tagsplorer import federate, lib, serve, simfs, utils, watch  # for setting the log level dynamically
 
 
 STREAM = sys.stdout if '--stdout' in sys.argv else sys.stderr
@@ -21,14 +22,38 @@ logging.basicConfig(
   datefmt = '%H:%M:%S')
 wrapExc(lambda: sys.argv.remove('--stdout'))  # remove if present
 _log = logging.getLogger(__name__)
-def log(func): return (lambda *s: func(sjoin([_() if callable(_) else _ for _ in s]), **({"stacklevel": 2} if sys.version_info >= (3, 8) else {})))
-debug, info, warn, error = log(_log.debug), log(_log.info), log(_log.warning), log(_log.error)
+def log(level): return (lambda *s: _log.isEnabledFor(level) and _log.log(level, sjoin([_() if callable(_) else _ for _ in s]), **({"stacklevel": 2} if sys.version_info >= (3, 8) else {})))  # callable arguments are only evaluated if the level is enabled
+debug, info, warn, error = log(logging.DEBUG), log(logging.INFO), log(logging.WARNING), log(logging.ERROR)
 
 
 with open(os.path.join(os.path.dirname(__file__), 'VERSION'), encoding = 'utf-8') as fd: VERSION = fd.read()
 APPSTR  = f"{APPNAME} version {VERSION}  (C) 2016-2021  Arne Bachmann"
 
 
+def setLogLevel(level):
+  ''' Apply the log level to all modules. '''
+  _log.setLevel(level)
+  for mod in (federate, lib, serve, simfs, utils, watch): mod._log.setLevel(level)
+
+
+def rememberCodec(cfg, spec):
+  ''' Store the index codec in the configuration, for all further index updates. '''
+  cfg.index_codec = spec
+  entries = dictGetSet(dictGetSet(cfg.paths, '', dd()), GLOBAL, [])
+  entries[:] = [kv for kv in entries if kv.split("=")[0].lower() != "index_codec"] + [f"index_codec={spec}"]
+
+
+def writeMetrics(target):
+  ''' Write the collected timings and counters as JSON.
+      target: file name, or '-' for standard error
+  '''
+  import json
+  data = json.dumps(dict(command = sys.argv[1:], **metrics.report()), indent = 2)
+  if target == '-': print(data, file = sys.stderr)
+  else:
+    with open(target, 'w', encoding = "utf-8") as fd: fd.write(data + NL)
+
+
 class Profiler:
   def __init__(_):
     import cProfile
@@ -137,11 +162,41 @@ class Main:
         if   not isUnderRoot(folder, abspath): error(f"Configured mapped folder '{other}' for '{path}' is outside indexed folder tree, please fix"); stop = True; continue
         elif not isDir(              abspath): error(f"Configured mapped folder '{other}' for '{path}' not found, please fix"); stop = True; continue
     if stop: return None, 1
-    idx = Indexer(folder)  # no need to load the old index
-    idx.walk(cfg)  # track all files using the configuration settings
+    try: spec, rate = _.indexCodec()  # validate before walking
+    except ValueError: error(f"Unknown index codec '{_.options.index_codec}'"); return None, 1
+    idx = Indexer(folder)  # no need to load the old index, unless re-using its folder listings or shards
+    if (_.options.incremental or _.options.shards) and os.path.exists(os.path.join(meta, INDEX)): idx.load(os.path.join(meta, INDEX), ignore_skew = True)
+    names = _.selectShards(idx, meta)
+    if names is None: return None, 1
+    if names:  # keep the index of all other folders
+      idx.cfg = cfg
+      idx.walkShards(names, incremental = _.options.incremental, jobs = _.options.jobs)
+    else: idx.walk(cfg, incremental = _.options.incremental, jobs = _.options.jobs)  # track all files using the configuration settings
+    if rate: spec = idx.selectCodec(rate).spec; warn(f"Selected index codec {spec} for {rate:.0f} MB/s")
+    if spec: rememberCodec(cfg, spec)
     if not _.options.simulate: idx.store(os.path.join(meta, INDEX), idx.timestamp)
     return idx, 0
 
+  def indexCodec(_):
+    ''' Parse the --index-codec option.
+        returns: 2-tuple(codec specification or None, disk read rate in MB/s to benchmark codecs for, or None)
+        raises ValueError for unknown codecs
+    '''
+    spec = _.options.index_codec
+    if spec and spec.lower().partition(":")[0] == "auto": return None, float(spec.partition(":")[2] or INDEX_READ_RATE)
+    return (IndexCodec(spec).spec if spec else None), None
+
+  def selectShards(_, idx, meta):
+    ''' Determine the index shards to re-walk for the --shard options.
+        idx:     previous index, loaded if a shard was requested
+        meta:    folder of the configuration file
+        returns: list of shard names, empty to walk the entire index, or None if no shard matches
+    '''
+    names = [name for name in sorted(idx.shards or ()) if xany(lambda glob: normalizer.globmatch(name, glob), _.options.shards)]
+    if _.options.shards and not names: error("No index shard matches " + COMB.join(_.options.shards)); return None
+    if names and Configuration().load(meta, idx.timestamp): warn("Configuration was modified since the last update. Update entire index"); return []
+    return names
+
   def find(_):
     ''' Find and display all folders that match the provided tags in _.options.includes while excluding those from _.options.excludes.
         returns: exit code
@@ -150,6 +205,8 @@ class Main:
     poss.extend(splitTags(_.options.includes))
     negs.extend(splitTags(_.options.excludes))
     poss, negs = removeTagPrefixes(poss, negs)  # removes +/-
+    if _.options.federate: return _.federate(poss, negs)
+    if _.options.port is not None: return _.query(poss, negs)
 
     folder, meta = getRoot(_.options, _.args)
     indexFile = os.path.join(meta, INDEX)
@@ -160,38 +217,31 @@ class Main:
       if code: return code
     else:
       idx = Indexer(folder)
-      idx.load(indexFile, ignore_skew = _.options.keep_index)  # load search index from root
+      idx.load(indexFile, ignore_skew = _.options.keep_index, jobs = _.options.jobs)  # load search index from root
     normalizer.setupCasematching(not (_.options.ignore_case or not idx.cfg.case_sensitive))  # case option can be overriden by --ignore-case
     poss, negs = map(lambda l: list(map(normalizer.filenorm, l)), (poss, negs))  # convert search terms to normalized case, if necessary
     debug("Effective search filters +<{COMB.join(poss)}> -<{COMB.join(negs)}>")
     _exts = [ext for ext in poss + negs if ext and ext[0] == DOT]
     if len(_exts) > 1: error(f"Cannot match anything if more than one file extension is specified ({COMB.join(_exts)})"); return 1
 
-    info(f"Search '{idx.root}' for tags +<{COMB.join(poss)}> -<{COMB.join(negs)}>")
-    paths = idx.findFolders(poss, negs)
-    debug(f"Found {len(paths)} potential path matches")
-    #[debug(path) for path in paths]  # optimistic: all folders "seem" to match given tags, but only some might actually do (e.g. due to excludes)
-
-    if len(paths) == 0 and xany(lambda x: isGlob(x) or DOT in x, negs): paths = idx.findFolders([], [], returnAll = True, checkPaths = True)  # for globs and extensions return all folders since filtering happens later
     if _.options.onlyfolders:
-      for p in poss: paths[:] = [x for x in paths if not isGlob(p) or normalizer.globmatch(safeRSplit(x), p)]  # successively reduce paths down to matching positive tags: in --dirs mode tags currently have to be folder names TODO later we should reflect actual mapping
-      for n in negs: paths[:] = [x for x in paths if not isGlob(n) or not normalizer.globmatch(safeRSplit(x), n)]  # TODO is this too strict and ignores configured tags and the index entirely?
+      paths = [path for path, files in idx.search(poss, negs, onlyfolders = True, explain = _.options.explain, limit = _.options.limit)]
       info(f"Found {len(paths)} folders for +<{COMB.join(poss)}> -<{COMB.join(negs)}>")
       prefix = idx.root if not _.options.relative else ''
+      metrics.count("folders_emitted", len(paths))
       try:
-        if len(paths): print(NL.join(prefix + path for path in paths))
+        with metrics.phase("output"):
+          if len(paths): print(NL.join(prefix + path for path in paths))
       except KeyboardInterrupt: pass  # idx.root + path + SLASH + file for file in files)); counter += len(files)
       return 0  # no file filtering requested
 
-    dcount, counter, skipped, run = 0, 0, [], None  # if showing also files
-    for path, fskip in ((p, idx.findFiles(p, poss, negs)) for p in paths):
-      files, skip = fskip  # deconstruct 2-tuple
-      if skip: skipped.append(path); continue  # memorize prefix to skip all folders under it HINT relies on breadth-first traversal (since ord('.') < ord('/') < ord('A'))
-      if xany(lambda skp: path.startswith(skp), skipped): continue  # is in skipped folder tree HINT if root is skipped, will if course ignore all subfolders as well
+    dcount, counter, run = 0, 0, None  # if showing also files
+    for path, files in idx.search(poss, negs, explain = _.options.explain, jobs = _.options.jobs, limit = _.options.limit):
       dcount += 1
       try:
         if len(files) > 0:
-          print(NL.join((idx.root if not _.options.relative else '') + path + SLASH + file for file in files))
+          with metrics.phase("output"): print(NL.join((idx.root if not _.options.relative else '') + path + SLASH + file for file in files))
+          metrics.count("files_emitted", len(files))
           counter += len(files)  # incremental output
           run = list(files)[0]
       except KeyboardInterrupt: break
@@ -204,6 +254,75 @@ class Main:
         except subprocess.TimeoutExpired: warn("Still running")
     return 0
 
+  def query(_, poss, negs):
+    ''' Thin client: let a running server (tp --serve) answer the search instead of loading the index.
+        returns: exit code
+    '''
+    from tagsplorer.serve import query
+    try: result = query(_.options.port, poss + ["-" + n for n in negs], onlyfolders = _.options.onlyfolders, ignore_case = _.options.ignore_case, limit = _.options.limit)
+    except Exception as E: error(f"Search on server port {_.options.port} failed: {E}"); return 1
+    prefix = result["root"] if not _.options.relative else ''
+    if _.options.onlyfolders: lines = [prefix + path for path in result["folders"]]
+    else: lines = [prefix + path + SLASH + file for path, files in result["files"] for file in files]
+    info(f"Found {len(lines)} " + ("folders" if _.options.onlyfolders else "files") + f" for +<{COMB.join(poss)}> -<{COMB.join(negs)}>")
+    try:
+      if len(lines): print(NL.join(lines))
+    except KeyboardInterrupt: pass
+    return 0
+
+  def federate(_, poss, negs):
+    ''' Search several roots concurrently, given as root folders, ports of running servers or registry files via --federate.
+        returns: exit code
+    '''
+    from tagsplorer.federate import Federation, resolveRoots
+    _exts = [ext for ext in poss + negs if ext and ext[0] == DOT]
+    if len(_exts) > 1: error(f"Cannot match anything if more than one file extension is specified ({COMB.join(_exts)})"); return 1
+    federation = Federation(resolveRoots(_.options.federate), keep_index = _.options.keep_index, jobs = _.options.jobs)
+    counter = 0
+    try:
+      for path, files in federation.search(poss, negs, onlyfolders = _.options.onlyfolders, ignore_case = _.options.ignore_case, limit = _.options.limit):
+        with metrics.phase("output"): print(path if _.options.onlyfolders else NL.join(path + SLASH + file for file in files))  # always absolute paths
+        counter += 1 if _.options.onlyfolders else len(files)
+    except KeyboardInterrupt: pass
+    metrics.count("folders_emitted" if _.options.onlyfolders else "files_emitted", counter)
+    info(f"Found {counter} " + ("folders" if _.options.onlyfolders else "files") + f" in {len(federation.entries) - len(federation.failed)} roots for +<{COMB.join(poss)}> -<{COMB.join(negs)}>")
+    return 1 if federation.failed else 0
+
+  def serve(_):
+    ''' Keep the index loaded and answer search requests on a localhost port until interrupted.
+        returns: exit code
+    '''
+    from tagsplorer.serve import Server
+    folder, meta = getRoot(_.options, _.args)
+    if not os.path.exists(os.path.join(meta, INDEX)):
+      error("No index file found. Crawl folder tree")
+      idx, code = _.updateIndex()
+      if code: return code
+    server = Server(folder, meta, SERVE_PORT if _.options.port is None else _.options.port, keep_index = _.options.keep_index, jobs = _.options.jobs)
+    warn(f"Serve searches in '{folder}' on http://127.0.0.1:{server.server_port}/search")
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally: server.server_close()
+    return 0
+
+  def watch(_):
+    ''' Keep the index file current by applying file system changes until interrupted.
+        returns: exit code
+    '''
+    from tagsplorer.watch import Watcher
+    folder, meta = getRoot(_.options, _.args)
+    indexFile = os.path.join(meta, INDEX)
+    if not os.path.exists(indexFile):
+      error("No index file found. Crawl folder tree")
+      idx, code = _.updateIndex()
+      if code: return code
+    idx = Indexer(folder)
+    idx.load(indexFile, ignore_skew = _.options.keep_index, jobs = _.options.jobs)
+    watcher = Watcher(idx, indexFile, jobs = _.options.jobs)
+    warn(f"Watch '{folder}' for modifications" + ("" if watcher.notify else " by polling"))
+    watcher.run()
+    return 0
+
   def config(_, unset = False, get = False, all = False):
     ''' Define, display or remove a global configuration parameter. '''
     value = ((_.options.setconfig if not get else (_.options.getconfig if not all else None)) if not unset else _.options.unsetconfig)
@@ -369,10 +488,11 @@ class Main:
       if code: return code
     else:
       idx = Indexer(folder)
-      idx.load(indexFile, ignore_skew = _.options.keep_index)
+      idx.load(indexFile, ignore_skew = _.options.keep_index, jobs = _.options.jobs)
     _.options.relative = True  # don't output full paths here
     warn("Configuration stats:")
     warn("  Compression level:", idx.cfg.compression)
+    warn("  Index codec:", "memory-mapped" if idx.cfg.mapped_index else idx.cfg.indexCodec().spec)
     warn("  Number of configured paths: %d" % len(idx.cfg.paths))
     warn("  Average number of markers per folder: %.1f" % ((sum([len(_) for _ in idx.cfg.paths.values()]) / len(idx.cfg.paths)) if idx.cfg.paths else 0.))  # e.g. skip, ignore, manual tags
     warn("  Average number of entries per folder: %.1f" % ((sum([sum([len(__) for __ in _.values()]) for _ in idx.cfg.paths.values()]) / len(idx.cfg.paths)) if idx.cfg.paths else 0.))  # e.g. skip
@@ -382,19 +502,19 @@ class Main:
     warn("  Timestamp:", time.strftime("%Y-%m-%d@%H:%M", time.localtime(idx.timestamp / 1000.)))
     warn("  Timestamp (ms epoch):", idx.timestamp)
     warn("  Number of tags:",   len(idx.tagdirs))
+    if idx.shards: warn("  Index shards:", COMB.join(sorted(idx.shards)))
     info("Tags and folders:")  # (occurrence = same name for different folder name references")
     if not _.options.verbose and not _.options.debug_on: return 0
     byOccurrence = dd()
     for i, t in enumerate(frozenset(idx.tagdirs)):
-      byOccurrence[idx.tagdirs.count(t)].append(i)  # map number of tag occurrences in index to their tagdir indices
-    _cache = {}
+      byOccurrence[len(idx.name2tagdirs[t])].append(i)  # map number of tag occurrences in index to their tagdir indices
     for n, ts in sorted(byOccurrence.items()):
       info(f"  {n} occurence%s for entries %s" % ("s" if n > 1 else "", COMB.join([str(_) for _ in sorted(ts)])))
       if not _.options.debug_on: return 0
       byMapping = dd()
       for t in ts: byMapping[idx.tagdirs[t]].extend(idx.tagdir2paths[t])  # aggregate all mappings
       for t in sorted(byMapping.keys(), key = caseCompareKey):
-        debug(f"    Entry '{t}' (%s) maps to: %s" % (COMB.join([str(i) for i, x in enumerate(idx.tagdirs) if x == t]), ', '.join(["%s (%d)" % (idx.getPath(_i, _cache), _i) for _i in byMapping[t]])))
+        debug(f"    Entry '{t}' (%s) maps to: %s" % (COMB.join([str(i) for i in idx.name2tagdirs[t]]), ', '.join(["%s (%d)" % (idx.getPath(_i), _i) for _i in byMapping[t]])))
     return 0
 
   def parse_and_run(_):
@@ -406,6 +526,10 @@ class Main:
     op.add_option('-r', '--root',           action = "store",       dest = "root",        default = None,  type = str, help = "Specify root folder of file tree, default: current folder")
     op.add_option('-i', '--index',          action = "store",       dest = "index",       default = None,  type = str, help = "Specify alternative index folder (if different from root)")
     op.add_option('-U', '--update',         action = "store_true",  dest = "update",      default = False,             help = "Force-update the index, crawl files in folder tree")
+    op.add_option(      '--incremental',    action = "store_true",  dest = "incremental", default = False,             help = "Only re-scan folders modified since the last update")
+    op.add_option(      '--shard',          action = "append",      dest = "shards",      default = [],                help = "With -U: only re-walk the index shards of the top-level folders matching this glob")
+    op.add_option(      '--index-codec',    action = "store",       dest = "index_codec", default = None,  type = str, help = "With -U: store the index with this codec from now on, e.g. pickle, zlib:2, lzma:6 or marshal+zlib:1, or benchmark codecs via auto[:<disk MB/s>]")
+    op.add_option('-j', '--jobs',           action = "store",       dest = "jobs",        default = 1,     type = int, help = "Number of threads for scanning folders and filtering files, default: 1")
     op.add_option('-s', '--search',         action = "append",      dest = "includes",    default = [],                help = "Find files by tags (default action if no option specified)")
     op.add_option('-x', '--exclude',        action = "append",      dest = "excludes",    default = [],                help = "Tags to ignore. Same as -<tag>")
     op.add_option('-t', '--tag',            action = "store",       dest = "tag",         default = None,  type = str, help = "Set   tag(s) for given file(s) or glob(s): tp -t tag,tag2,-tag3... file,glob...")
@@ -421,25 +545,30 @@ class Main:
     op.add_option('-c', '--ignore-case',    action = "store_true",  dest = "ignore_case", default = False,             help = "Search case-insensitive (overrides option in index)")
     op.add_option('-n', '--simulate',       action = "store_true",  dest = "simulate",    default = False,             help = "Don't write anything")
     op.add_option('-k', '--keep-index',     action = "store_true",  dest = "keep_index",  default = False,             help = "Don't update the index, even if configuration was changed")
+    op.add_option(      '--explain',        action = "store_true",  dest = "explain",     default = False,             help = "Show the query plan with estimated and actual numbers of folders")
+    op.add_option('-l', '--limit',          action = "store",       dest = "limit",       default = None,  type = int, help = "Stop searching after finding that many files (or folders with --dirs)")
     op.add_option(      '--dirs',           action = "store_true",  dest = "onlyfolders", default = False,             help = "Only find folders that contain matches")
     op.add_option('-v', '--verbose',        action = "store_true",  dest = "verbose",     default = False,             help = "Display more information")
     op.add_option('-V', '--debug',          action = "store_true",  dest = "debug_on",    default = False,             help = "Display internal data state")
+    op.add_option(      '--federate',       action = "append",      dest = "federate",    default = [],                help = "Search several roots concurrently: an indexed root folder, ':<port>' of a running server, or a registry file listing one of these per line")
+    op.add_option(      '--serve',          action = "store_true",  dest = "serve",       default = False,             help = "Keep the index loaded and answer searches from clients on a localhost port")
+    op.add_option(      '--port',           action = "store",       dest = "port",        default = None,  type = int, help = f"Port for --serve (default: {SERVE_PORT}), or send searches to the server on that port")
+    op.add_option(      '--watch',          action = "store_true",  dest = "watch",       default = False,             help = "Keep the index updated on file system modifications until interrupted")
     op.add_option(      '--stats',          action = "store_true",  dest = "stats",       default = False,             help = "List index internals")
     op.add_option(      '--profile',        action = "store_true",  dest = "profile",     default = False,             help = "Profile code performance")
+    op.add_option(      '--metrics',        action = "store",       dest = "metrics",     default = None,  type = str, help = "Write per-phase timings and counters as JSON to this file, or '-' for standard error")
     op.add_option(      '--relative',       action = "store_true",  dest = "relative",    default = False,             help = "Output files with root-relative paths only")  # instead of absolute file system paths
     op.add_option(      '--simulate-winfs', action = "store_true",  dest = "winfs",       default = True,              help = optparse.SUPPRESS_HELP)  # "Simulate case-insensitive file system")  # but option is checked outside parser in simfs.py
     op.add_option('-h', '--help',           action = "help",                                                           help = optparse.SUPPRESS_HELP)  # whoever showed the help, doesn't need this information
     _.options, _.args = op.parse_args()  # TODO replace with argparse?
-    if _.options.profile: _.options.profile = Profiler()
+    _.startReporting()
     reserved1, reserved2 = (set(_) for _ in splitByPredicate([_.get_opt_string() for _ in op.option_list], lambda e: e[:2] != '--'))  # allow option switches operate as an exclude tag when masked by an additional dash
     _.args, excludes = splitByPredicate(_.args,   lambda e: e[:3] != '---')      # split definitive excludes (triple dash)
     _.args, exclude_ = splitByPredicate(_.args,   lambda e: e[:2] != '--')       # split potential  excludes (double dash)
     add2, exclude2   = splitByPredicate(exclude_, lambda e: e not in reserved2)  # filter out program options with double dash
     add1, exclude1   = splitByPredicate(exclude2, lambda e: e not in reserved1)  # filter out program options with single dash
     _.options.excludes.extend([_.lstrip("---") for _ in excludes] + [_.lstrip("--") for _ in add2] + [_.lstrip("-") for _ in add1])  # update excludes option
-    logLevel = logging.DEBUG if _.options.debug_on else (logging.INFO if _.options.verbose else logging.WARNING)
-    _log.setLevel(logLevel)
-    for mod in (lib, simfs, utils): mod._log.setLevel(logLevel)
+    setLogLevel(logging.DEBUG if _.options.debug_on else (logging.INFO if _.options.verbose else logging.WARNING))
     debug(f"Options:   {_.options}")
     debug(f"Arguments: {_.args}")
     code = 0  # exit code
@@ -454,14 +583,26 @@ class Main:
     elif _.options.showconfig:  code = _.config(get   = True, all = True)
     elif _.options.resetconfig: code = _.reset()
     elif _.options.stats:       code = _.stats()
+    elif _.options.serve:       code = _.serve()
+    elif _.options.watch:       code = _.watch()
     elif _.args \
       or _.options.includes \
       or _.options.excludes:    code = _.find()
     else: error(f"No option specified. Use '--help' to list all options"); debug(f"{sys.argv} {_.options} {_.args}")
     info(f'Finished at {time.strftime("%H:%M:%S")} after %.1fs' % (time.time() - ts))
-    if _.options.profile: _.options.profile.stats()
+    _.stopReporting()
     sys.exit(code)
 
+  def startReporting(_):
+    ''' Start profiling or collecting metrics, if requested. '''
+    if _.options.profile: _.options.profile = Profiler()
+    if _.options.metrics: metrics.reset(); metrics.enabled = True
+
+  def stopReporting(_):
+    ''' Show the profile or write the collected metrics, if requested. '''
+    if _.options.profile: _.options.profile.stats()
+    if _.options.metrics: writeMetrics(_.options.metrics)
+
 
 def main(): Main().parse_and_run()  # Main entry point for console tools (setuptools)
 
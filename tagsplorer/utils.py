@@ -1,14 +1,15 @@
 ''' tagsPlorer utilities  (C) 2016-2021  Arne Bachmann  https://github.com/ArneBachmann/tagsplorer '''
 
-import collections, fnmatch, logging, os, sys, time
+import collections, contextlib, fnmatch, logging, os, re, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 
-from tagsplorer.constants import COMB, ON_WINDOWS, SKIP, SLASH
+from tagsplorer.constants import ALL, COMB, ON_WINDOWS, SLASH
 
 
 _log = logging.getLogger(__name__)
-def log(func): return (lambda *s: func(sjoin([_() if callable(_) else _ for _ in s]), **({"stacklevel": 2} if sys.version_info >= (3, 8) else {})))
-debug, info, warn, error = log(_log.debug), log(_log.info), log(_log.warning), log(_log.error)
+def log(level): return (lambda *s: _log.isEnabledFor(level) and _log.log(level, sjoin([_() if callable(_) else _ for _ in s]), **({"stacklevel": 2} if sys.version_info >= (3, 8) else {})))  # callable arguments are only evaluated if the level is enabled
+debug, info, warn, error = log(logging.DEBUG), log(logging.INFO), log(logging.WARNING), log(logging.ERROR)
 
 
 pathNorm = (lambda s: s.replace(os.sep, SLASH)) if ON_WINDOWS else lambda _: _  # HINT do not convert into a function to allow ternary expression here
@@ -34,13 +35,60 @@ class Normalizer(object):
     ['dot.folder']
     '''
     if not suppress: debug("Case-sensitive matching: " + ("On" if case_sensitive else "Off"))
+    _.case_sensitive = case_sensitive
     _.filenorm   = (lambda _: _)       if case_sensitive else str.lower
     _.globmatch  = fnmatch.fnmatchcase if case_sensitive else lambda f, g: fnmatch.fnmatch(f.lower(), g.lower())
     _.globfilter = casefilter if case_sensitive else \
                    (lambda lizt, pat: [name for name in lizt if fnmatch.fnmatch(name.lower(), pat.lower())])  # HINT lower maybe not necessary
+
+  def globregex(_, pat):
+    ''' Compile a glob for repeated matching in the current case matching mode.
+    >>> n = Normalizer(); n.setupCasematching(False, suppress = True)
+    >>> print((bool(n.globregex("a?.T*").match("AB.txt")), bool(n.globregex("a*").match("ba"))))
+    (True, False)
+    '''
+    return re.compile(fnmatch.translate(pat), 0 if _.case_sensitive else re.IGNORECASE)
 normalizer = Normalizer()  # keep a static module-reference
 
 
+class Metrics(object):
+  ''' Registry of wall times per processing phase and of event counters, reported via --metrics.
+      Does nothing unless enabled, and is safe to use from worker threads.
+  >>> m = Metrics(); m.enabled = True
+  >>> with m.phase("a"): m.count("b"); m.count("b", 2)
+  >>> r = m.report(); print((sorted(r["phases"]["a"]), r["counters"]))
+  (['calls', 'seconds'], {'b': 3})
+  '''
+
+  def __init__(_):
+    _.enabled = False
+    _.lock = threading.Lock()
+    _.reset()
+
+  def reset(_):
+    _.started = time.perf_counter()
+    _.phases = collections.defaultdict(lambda: [0., 0])  # name -> [accumulated seconds, number of calls]
+    _.counters = collections.defaultdict(int)
+
+  def count(_, name, n = 1):
+    if not _.enabled: return
+    with _.lock: _.counters[name] += n
+
+  @contextlib.contextmanager
+  def phase(_, name):
+    ''' Context manager that accumulates the wall time spent inside under the given phase name. '''
+    if not _.enabled: yield; return
+    start = time.perf_counter()
+    try: yield
+    finally:
+      duration = time.perf_counter() - start
+      with _.lock: entry = _.phases[name]; entry[0] += duration; entry[1] += 1
+
+  def report(_):
+    return {"seconds": time.perf_counter() - _.started, "phases": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in _.phases.items()}, "counters": dict(_.counters)}
+metrics = Metrics()  # module-level registry
+
+
 def dd(): return collections.defaultdict(list)
 
 
@@ -171,10 +219,24 @@ def findIndexOrAppend(lizt, elem):
   return lindex(lizt, elem, otherwise = lambda l, v: l.append(v) or len(l) - 1)
 
 
-def isDir(f):  return wrapExc(lambda: os.path.isdir(f) and not os.path.islink(f), False)  # HINT silently catches encoding errors
+def findIndexOrAppendIndexed(lizt, index, elem):
+  ''' Same as findIndexOrAppend, but in constant time using a dictionary of element -> first index, which is updated accordingly.
+  >>> l, i = [1, 2], {1: 0, 2: 1}; findIndexOrAppendIndexed(l, i, 2)
+  1
+  >>> findIndexOrAppendIndexed(l, i, 4)
+  2
+  >>> print(l, i)
+  [1, 2, 4] {1: 0, 2: 1, 4: 2}
+  '''
+  try: return index[elem]
+  except KeyError: index[elem] = len(lizt); lizt.append(elem)
+  return index[elem]
+
 
+def isDir(f):  metrics.count("stat_calls", 2); return wrapExc(lambda: os.path.isdir(f) and not os.path.islink(f), False)  # HINT silently catches encoding errors
 
-def isFile(f): return wrapExc(lambda: os.path.isfile(f), False)  # handle "no file" errors
+
+def isFile(f): metrics.count("stat_calls"); return wrapExc(lambda: os.path.isfile(f), False)  # handle "no file" errors
 
 
 def isGlob(f):
@@ -190,6 +252,30 @@ def isGlob(f):
   return '*' in f or '?' in f
 
 
+def globToRegex(glob):
+  ''' Translate a glob into a regular expression like fnmatch.translate(), but matching within one path constituent only, i.e. "*", "?" and "[!...]" don't match slashes.
+  >>> print(globToRegex("a*.t?t"))
+  a[^/]*\\.t[^/]t
+  >>> print(globToRegex("tmp[0-9][!x]["))
+  tmp[0-9][^x/]\\[
+  '''
+  i, n, result = 0, len(glob), []
+  while i < n:
+    c = glob[i]; i += 1
+    if   c == ALL: result.append("[^/]*")
+    elif c == "?": result.append("[^/]")
+    elif c == "[":  # character set
+      j = i + 1 if i < n and glob[i] == "!" else i
+      if j < n and glob[j] == "]": j += 1  # a leading bracket is part of the set
+      j = glob.find("]", j)
+      if j < 0: result.append("\\["); continue  # no set, but a literal bracket
+      chars = re.match(r"\(\?s:(.*)\)\\[Zz]$", fnmatch.translate(glob[i - 1:j + 1]), re.DOTALL).group(1)  # let fnmatch translate the set
+      i = j + 1
+      result.append("[^/]" if chars == "." else (chars[:-1] + "/]" if chars[:2] == "[^" else chars))  # negated sets exclude slashes as well
+    else: result.append(re.escape(c))
+  return "".join(result)
+
+
 def isUnderRoot(root, folder):
   r''' Check if a filepath is under the discovered repository root.
   >>> isUnderRoot("C:\\", "D:\\file.txt")
@@ -263,65 +349,6 @@ def caseCompareKey(c):
   return ord(c.lower())
 
 
-def constituentInPath(path, skip):
-  if path.endswith(SLASH + skip):  return True  # also covers: if path == SLASH + skip: return True
-  if SLASH + skip + SLASH in path: return True  # also covers: if path.startswith(SLASH + skip + SLASH): return True
-  return False
-
-
-def pathHasGlobalSkip(path, skips):
-  ''' True if any path matches the global skip paths (regex for full, beginning, middle, end).
-      Uses dynamic generation of regular expressions TODO path sanitization before re for security
-  >>> pathHasGlobalSkip('/a', ['a'])
-  True
-  >>> pathHasGlobalSkip('/b', ['a'])
-  False
-  >>> pathHasGlobalSkip('/a/b/c', ['b'])
-  True
-  '''
-  assert isinstance(path, str)
-  assert isinstance(skips, list)
-  return xany(lambda skip: constituentInPath(path, skip), skips)
-
-
-def pathHasGlobalIgnore(path, ignores):
-  ''' Check if last path constituent matches any global ignore pattern.
-  >>> normalizer.setupCasematching(True)
-  >>> pathHasGlobalIgnore('/a/b', ['b'])
-  True
-  >>> pathHasGlobalIgnore('/a/b', ['B'])
-  False
-  >>> normalizer.setupCasematching(False)
-  >>> pathHasGlobalIgnore('/a/b', ['c'])
-  False
-  >>> pathHasGlobalIgnore('/a/b', ['C'])
-  False
-  >>> pathHasGlobalIgnore('', [''])
-  True
-  '''
-  assert isinstance(path, str)
-  assert isinstance(ignores, list)
-  if not path: return '' in ignores  # check root ignore
-  basename = path[path.rindex(SLASH) + 1:] if SLASH in path else path
-  return xany(lambda ignore: normalizer.globmatch(basename, ignore), ignores)
-
-
-def anyParentIsSkipped(path, paths):
-  ''' True if any prefix path of path is marked as "skip", so that all children can be skipped, too.
-  >>> anyParentIsSkipped('/a/b', {'/a': {'skip': ''}})
-  True
-  >>> anyParentIsSkipped('/a/b', {'/a/b': {'ignore': ''}})
-  False
-  '''
-  assert isinstance(path, str)
-  assert isinstance(paths, dict)
-  def append(elem): nonlocal current; current += (SLASH + elem); return current  # append expression
-  elements = path.split(SLASH)
-  current = elements[0]
-  if SKIP in paths.get(current, {}): return True
-  return xany(lambda i: SKIP in paths.get(append(elements[i]), {}), range(1, len(elements)))  # test all parent paths
-
-
 def splitTags(lizt):
   ''' Parse comma-separated arguments like tags.
   >>> print(splitTags([]))
@@ -347,4 +374,24 @@ def removeTagPrefixes(poss, negs):
   return [p.lstrip('+') for p in poss], [n.lstrip('-') for n in negs]
 
 
+def orderedMap(func, lizt, jobs, window = None):
+  ''' Apply a function to all elements on a pool of worker threads, yielding the results in the order of the elements.
+      At most window elements are processed or waiting to be consumed at any time, which bounds memory use and allows stopping early.
+  >>> print(list(orderedMap(lambda x: x * x, range(5), 3)))
+  [0, 1, 4, 9, 16]
+  >>> print(list(orderedMap(lambda x: -x, [1, 2], 1)))  # no threads
+  [-1, -2]
+  '''
+  if jobs <= 1: yield from map(func, lizt); return
+  pending = collections.deque()
+  with ThreadPoolExecutor(max_workers = jobs) as pool:
+    try:
+      for elem in lizt:
+        pending.append(pool.submit(func, elem))
+        if len(pending) >= (window or 4 * jobs): yield pending.popleft().result()
+      while pending: yield pending.popleft().result()
+    finally:
+      for future in pending: future.cancel()  # consumer stopped early
+
+
 if __name__ == '__main__': import doctest; doctest.testmod()
@@ -0,0 +1,156 @@
+# coding=utf-8
+
+''' tagsPlorer index maintenance on file system changes  (C) 2021-2021  Arne Bachmann  https://github.com/ArneBachmann/tagsplorer '''
+
+import ctypes, ctypes.util, errno, logging, os, select, struct, sys, time
+
+from tagsplorer.constants import CONFIG, INDEX, SHDFILES, WATCH_DELAY, WATCH_FLUSH, WATCH_POLL
+from tagsplorer.lib import Configuration
+from tagsplorer.utils import sjoin, wrapExc
+
+
+_log = logging.getLogger(__name__)
+def log(level): return (lambda *s: _log.isEnabledFor(level) and _log.log(level, sjoin([_() if callable(_) else _ for _ in s]), **({"stacklevel": 2} if sys.version_info >= (3, 8) else {})))  # callable arguments are only evaluated if the level is enabled
+debug, info, warn, error = log(logging.DEBUG), log(logging.INFO), log(logging.WARNING), log(logging.ERROR)
+
+
+class Inotify(object):
+  ''' Minimal binding of the Linux inotify API via ctypes, reporting changes to folder contents. '''
+
+  IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE, IN_DELETE_SELF, IN_MOVE_SELF = 0x40, 0x80, 0x100, 0x200, 0x400, 0x800
+  IN_Q_OVERFLOW, IN_IGNORED, IN_ONLYDIR, IN_NONBLOCK, IN_CLOEXEC = 0x4000, 0x8000, 0x1000000, 0o4000, 0o2000000
+  MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR  # file content modifications are irrelevant for the index
+  EVENT = struct.Struct("iIII")  # watch descriptor, mask, cookie, length of the (null-padded) name that follows
+
+  def __init__(_):
+    ''' Raises OSError if inotify is not available on this system. '''
+    if not sys.platform.startswith("linux"): raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+    _.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno = True)
+    _.fd = _.libc.inotify_init1(Inotify.IN_NONBLOCK | Inotify.IN_CLOEXEC)
+    if _.fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    _.wds = {}  # watch descriptor -> root-relative folder path
+
+  def add(_, root, folder):
+    ''' Watch a folder, if not yet watched. Raises OSError e.g. if the user's watch limit is exhausted. '''
+    wd = _.libc.inotify_add_watch(_.fd, os.fsencode(root + folder), Inotify.MASK)
+    if wd < 0:
+      code = ctypes.get_errno()
+      if code in (errno.ENOENT, errno.ENOTDIR): return  # removed in the meantime, will be noticed in the parent
+      raise OSError(code, f"Cannot watch '{root + folder}'" + (" (increase fs.inotify.max_user_watches)" if code == errno.ENOSPC else ""))
+    _.wds[wd] = folder
+
+  def remove(_, wd):
+    _.libc.inotify_rm_watch(_.fd, wd)
+    _.wds.pop(wd, None)
+
+  def read(_, timeout):
+    ''' Wait for events up to timeout seconds.
+        returns: set of root-relative folder paths with modified contents, or None if events were lost and all folders have to be checked
+    '''
+    changed = set()
+    if not select.select([_.fd], [], [], timeout)[0]: return changed
+    data = wrapExc(lambda: os.read(_.fd, 1 << 16), b"")
+    pos = 0
+    while pos + Inotify.EVENT.size <= len(data):
+      wd, mask, cookie, length = Inotify.EVENT.unpack_from(data, pos)
+      name = os.fsdecode(data[pos + Inotify.EVENT.size:pos + Inotify.EVENT.size + length].rstrip(b"\0"))
+      pos += Inotify.EVENT.size + length
+      if mask & Inotify.IN_Q_OVERFLOW: return None
+      if mask & Inotify.IN_IGNORED: _.wds.pop(wd, None); continue  # watch removed by the kernel (folder deleted or unmounted)
+      folder = _.wds.get(wd)
+      if folder is None or name in (CONFIG, INDEX, INDEX + ".tmp") or SHDFILES.fullmatch(name): continue  # our own index updates must not trigger another update
+      changed.add(folder)
+    return changed
+
+  def close(_): os.close(_.fd)
+
+
+class Watcher(object):
+  ''' Keep an index current by applying file system changes, and store it periodically.
+      On Linux, folders are watched via inotify, and only folders reported as modified are re-scanned.
+      Otherwise, or if inotify is unavailable or its watch limit is exhausted, all folders' modification stamps are polled instead (like "tp -U --incremental").
+      In both cases the index is re-assembled from the folder listings in memory, and stored at most every WATCH_FLUSH seconds.
+  '''
+
+  def __init__(_, idx, filename, jobs = 1, poll = False):
+    ''' idx:      loaded Indexer
+        filename: index file to store updates to. The configuration file is expected in the same folder
+        jobs:     number of threads for scanning folders
+        poll:     if True, don't use inotify
+    '''
+    _.idx, _.filename, _.jobs = idx, filename, jobs
+    _.meta = os.path.dirname(os.path.abspath(filename))
+    _.notify = None if poll else wrapExc(Inotify)
+    if _.notify is None: info("Poll folders for modifications every %.0fs" % WATCH_POLL)
+    _.cfgStamp = _.configStamp()
+    _.dirty = False  # index modified since last store
+    _.watch()
+
+  def configStamp(_): return wrapExc(lambda: os.stat(os.path.join(_.meta, CONFIG)).st_mtime_ns)
+
+  def watch(_):
+    ''' Add watches for all walked folders, and remove those for folders no longer indexed. Falls back to polling if watching fails. '''
+    if _.notify is None: return
+    folders = set(_.idx.getScans(shards = True))
+    try:
+      for wd in [wd for wd, folder in _.notify.wds.items() if folder not in folders]: _.notify.remove(wd)
+      for folder in folders - set(_.notify.wds.values()): _.notify.add(_.idx.root, folder)
+      debug(f"Watching {len(_.notify.wds)} folders")
+    except OSError as E:
+      warn(f"{E}. Poll folders for modifications every %.0fs instead" % WATCH_POLL)
+      _.notify.close(); _.notify = None
+
+  def update(_, changed):
+    ''' Apply modifications to the index.
+        changed: set of modified root-relative folders, or None to check all folders' modification stamps
+    '''
+    stamp, applied = _.configStamp(), False
+    if stamp != _.cfgStamp:  # configuration modified by user or other tp commands: update configured tags in place, or re-assemble with new settings
+      info("Reload configuration")
+      cfg = Configuration()
+      cfg.load(_.meta)
+      applied = _.idx.applyConfiguration(cfg)
+      if not applied: _.idx.cfg = cfg
+      _.cfgStamp, _.dirty = stamp, True
+    rescanned = 0 if applied and changed == set() else _.idx.walk(incremental = True, changed = changed, jobs = _.jobs)
+    if rescanned: _.dirty = True
+    _.watch()
+    return rescanned
+
+  def flush(_):
+    ''' Store the index if modified. '''
+    if not _.dirty: return
+    _.idx.store(_.filename)
+    _.cfgStamp, _.dirty = _.configStamp(), False  # configuration is stored along with the index
+
+  def run(_, stop = None, timeout = None):
+    ''' Process file system changes until interrupted, stop is set, or timeout seconds have passed.
+        stop: optional threading.Event to end watching from another thread
+    '''
+    started = updated = flushed = time.time()
+    try:
+      while not (stop and stop.is_set()) and (timeout is None or time.time() - started < timeout):
+        if _.notify is None:
+          if stop: stop.wait(WATCH_POLL)
+          else: time.sleep(WATCH_POLL)
+          changed = None  # check all folders' modification stamps
+        else:
+          changed = _.notify.read(WATCH_DELAY)
+          while changed:  # collect further events for a moment, as changes usually come in bursts
+            more = _.notify.read(WATCH_DELAY)
+            if more is None: changed = None  # events lost
+            elif more: changed.update(more)
+            else: break
+          retry = time.time() - updated >= WATCH_POLL and any(entry[0] is None for entry in _.idx.getScans(shards = True).values())  # listings modified during the last scan
+          if changed == set() and not retry and _.configStamp() == _.cfgStamp:
+            if _.dirty and time.time() - flushed >= WATCH_FLUSH: _.flush(); flushed = time.time()
+            continue  # nothing to do
+        if stop and stop.is_set(): break
+        info("Update index for " + ("all folders" if changed is None else f"{len(changed)} modified folders"))
+        _.update(changed)
+        updated = time.time()
+        if time.time() - flushed >= WATCH_FLUSH: _.flush(); flushed = time.time()
+    except KeyboardInterrupt: pass
+    finally:
+      _.flush()
+      if _.notify: _.notify.close(); _.notify = None